@@ -76,8 +76,23 @@ import os
 import math
 import copy
 import random
+import array
+import marshal
 import re
 import time
+import multiprocessing
+import multiprocessing.pool
+import threading
+import collections
+import struct
+import zlib
+import hashlib
+
+try:
+  import numpy               # optional, makes the coloring of player images much faster
+  import pygame.surfarray
+except ImportError:
+  numpy = None
 
 DEBUG_PROFILING = False
 DEBUG_FPS = False
@@ -89,6 +104,18 @@ def debug_log(message):
   if DEBUG_VERBOSE:      
     print(message)
 
+#------------------------------------------------------------------------------
+
+## Returns the value following given option in a list of command line
+#  arguments (e.g. get_argument_value(sys.argv,"--maps")), or None if there is
+#  no such option.
+
+def get_argument_value(arguments, name):
+  if name in arguments and arguments.index(name) + 1 < len(arguments):
+    return arguments[arguments.index(name) + 1]
+      
+  return None
+
 #==============================================================================
 
 class Profiler(object):
@@ -367,7 +394,7 @@ class Player(Positionable):
     self.state = Player.STATE_DEAD
     game_map.add_sound_event(SoundPlayer.SOUND_EVENT_DEATH)
     
-    random_animation = random.choice((
+    random_animation = game_map.random.choice((
       Renderer.ANIMATION_EVENT_DIE,
       Renderer.ANIMATION_EVENT_EXPLOSION,
       Renderer.ANIMATION_EVENT_RIP,
@@ -473,7 +500,7 @@ class Player(Positionable):
     if len(landing_tiles) == 0:    # this should practically not happen
       self.jumping_to = (self.jumping_from[0],self.jumping_from[1] + 1)
     else:
-      self.jumping_to = random.choice(landing_tiles)
+      self.jumping_to = game_map.random.choice(landing_tiles)
     
     self.state_time = 0
 
@@ -529,15 +556,19 @@ class Player(Positionable):
 
   ## Gives player an item with given code (see GameMap class constants). game_map
   #  is needed so that sounds can be made on item pickup - if no map is provided,
-  #  no sounds will be generated.
+  #  no sounds will be generated. Random choices are made with random_generator,
+  #  or with the map's generator if it is not given.
 
-  def give_item(self, item, game_map=None):
+  def give_item(self, item, game_map=None, random_generator=None):
+    if random_generator == None:
+      random_generator = game_map.random if game_map != None else random
+    
     self.items[item] = 1 if not item in self.items else self.items[item] + 1
       
     self.info_board_update_needed = True
       
     if item == GameMap.ITEM_RANDOM:
-      item = random.choice((
+      item = random_generator.choice((
         GameMap.ITEM_BOMB,
         GameMap.ITEM_FLAME,
         GameMap.ITEM_SUPERFLAME,
@@ -575,7 +606,7 @@ class Player(Positionable):
     elif item == GameMap.ITEM_THROWING_GLOVE:
       self.has_throwing_glove = True
     elif item == GameMap.ITEM_DISEASE:
-      chosen_disease = random.choice([
+      chosen_disease = random_generator.choice([
         (Player.DISEASE_SHORT_FLAME,SoundPlayer.SOUND_EVENT_DISEASE),     
         (Player.DISEASE_SLOW,SoundPlayer.SOUND_EVENT_SLOW),
         (Player.DISEASE_DIARRHEA,SoundPlayer.SOUND_EVENT_DIARRHEA),
@@ -594,7 +625,7 @@ class Player(Positionable):
           
           if len(players) > 1:     # should always be true
             while player_to_switch == self:
-              player_to_switch = random.choice(players)
+              player_to_switch = random_generator.choice(players)
           
           my_position = self.get_position()
           self.set_position(player_to_switch.get_position())
@@ -620,10 +651,6 @@ class Player(Positionable):
       new_bomb.set_position(tile_coordinates)
       new_bomb.move_to_tile_center()
     
-    game_map.add_bomb(new_bomb)
-    game_map.add_sound_event(SoundPlayer.SOUND_EVENT_BOMB_PUT)
-    self.bombs_left -= 1
-      
     if self.disease == Player.DISEASE_SHORT_FLAME:
       new_bomb.flame_length = 1
     elif self.disease == Player.DISEASE_FAST_BOMB:
@@ -634,6 +661,10 @@ class Player(Positionable):
       self.detonator_bombs.append(new_bomb)
       self.detonator_bombs_left -= 1
 
+    game_map.add_bomb(new_bomb)
+    game_map.add_sound_event(SoundPlayer.SOUND_EVENT_BOMB_PUT)
+    self.bombs_left -= 1
+
   #----------------------------------------------------------------------------
     
   def get_bombs_left(self):
@@ -835,6 +866,7 @@ class Player(Positionable):
           if self.boxing:
             destination_tile = (forward_tile[0] + direction_vector[0] * 3,forward_tile[1] + direction_vector[1] * 3)           
             bomb_hit.send_flying(destination_tile)
+            game_map.bomb_moved(bomb_hit)
             game_map.add_sound_event(SoundPlayer.SOUND_EVENT_KICK)
           elif self.has_shoe:
             # align the bomb in case of kicking an already moving bomb
@@ -961,6 +993,7 @@ class Player(Positionable):
         direction_vector = self.get_direction_vector()
         destination_tile = (forward_tile[0] + direction_vector[0] * 3,forward_tile[1] + direction_vector[1] * 3)
         bomb_thrown.send_flying(destination_tile)
+        game_map.bomb_moved(bomb_thrown)
         self.wait_for_bomb_release = True
         self.throwing_time_left = 200
     
@@ -1046,6 +1079,7 @@ class Bomb(Positionable):
     self.movement = Bomb.BOMB_NO_MOVEMENT
     self.has_exploded = False
     self.flight_info = BombFlightInfo()
+    self.number = -1                                 ##< number that identifies the bomb within its map, given by GameMap.add_bomb
 
   #----------------------------------------------------------------------------
       
@@ -1101,11 +1135,17 @@ class Flame(object):
 
 #==============================================================================
 
+## A view of one tile of a GameMap. The tile data are stored in flat arrays
+#  of the map (see GameMap.tile_kinds etc.), this class only provides
+#  a convenient access to them.
+
 class MapTile(object):
   TILE_FLOOR = 0                     ##< walkable map tile
   TILE_BLOCK = 1                     ##< non-walkable but destroyable map tile
   TILE_WALL = 2                      ##< non-walkable and non-destroyable map tile
   
+  NOTHING = -1                       ##< value stored in the map arrays for no item or no special object
+  
   SPECIAL_OBJECT_TRAMPOLINE = 0
   SPECIAL_OBJECT_TELEPORT_A = 1
   SPECIAL_OBJECT_TELEPORT_B = 2
@@ -1117,17 +1157,85 @@ class MapTile(object):
 
   #----------------------------------------------------------------------------
 
-  def __init__(self, coordinates):
-    self.kind = MapTile.TILE_FLOOR
-    self.flames = []
+  def __init__(self, game_map, coordinates):
+    self.game_map = game_map
     self.coordinates = coordinates
-    self.to_be_destroyed = False     ##< Flag that marks the tile to be destroyed after the flames go out.
-    self.item = None                 ##< Item that's present on the file
-    self.special_object = None       ##< special object present on the tile, like trampoline or teleport
-    self.destination_teleport = None ##< in case of special_object equal to SPECIAL_OBJECT_TELEPORT_A or SPECIAL_OBJECT_TELEPORT_B holds the destionation teleport tile coordinates
+    self.index = coordinates[1] * GameMap.MAP_WIDTH + coordinates[0]   ##< index to the map arrays
+
+  #----------------------------------------------------------------------------
+
+  def __get_kind(self):
+    return self.game_map.tile_kinds[self.index]
+
+  def __set_kind(self, kind):
+    self.game_map.tile_kinds[self.index] = kind
+
+  kind = property(__get_kind,__set_kind)
+
+  #----------------------------------------------------------------------------
+
+  ## Item that's present on the tile (None = no item).
+
+  def __get_item(self):
+    item = self.game_map.tile_items[self.index]
+    return item if item != MapTile.NOTHING else None
+
+  def __set_item(self, item):
+    self.game_map.tile_items[self.index] = item if item != None else MapTile.NOTHING
+
+  item = property(__get_item,__set_item)
+
+  #----------------------------------------------------------------------------
+
+  ## Special object present on the tile, like trampoline or teleport (None = no object).
+
+  def __get_special_object(self):
+    special_object = self.game_map.tile_special_objects[self.index]
+    return special_object if special_object != MapTile.NOTHING else None
+
+  def __set_special_object(self, special_object):
+    self.game_map.tile_special_objects[self.index] = special_object if special_object != None else MapTile.NOTHING
+
+  special_object = property(__get_special_object,__set_special_object)
+
+  #----------------------------------------------------------------------------
+
+  ## Flag that marks the tile to be destroyed after the flames go out.
+
+  def __get_to_be_destroyed(self):
+    return self.game_map.tile_destroy_flags[self.index] != 0
+
+  def __set_to_be_destroyed(self, to_be_destroyed):
+    self.game_map.tile_destroy_flags[self.index] = 1 if to_be_destroyed else 0
+
+  to_be_destroyed = property(__get_to_be_destroyed,__set_to_be_destroyed)
+
+  #----------------------------------------------------------------------------
+
+  ## List of flames on the tile (the list itself is stored in the map, so it can be modified).
+
+  def __get_flames(self):
+    return self.game_map.tile_flames[self.index]
+
+  flames = property(__get_flames)
+
+  #----------------------------------------------------------------------------
+
+  ## In case of special_object equal to SPECIAL_OBJECT_TELEPORT_A or
+  #  SPECIAL_OBJECT_TELEPORT_B holds the destionation teleport tile coordinates.
+
+  def __get_destination_teleport(self):
+    return self.game_map.tile_teleport_destinations.get(self.index,None)
+
+  def __set_destination_teleport(self, coordinates):
+    self.game_map.tile_teleport_destinations[self.index] = coordinates
+
+  destination_teleport = property(__get_destination_teleport,__set_destination_teleport)
+
+  #----------------------------------------------------------------------------
 
   def shouldnt_walk(self):
-    return self.kind in [MapTile.TILE_WALL,MapTile.TILE_BLOCK] or len(self.flames) >= 1 or self.special_object == MapTile.SPECIAL_OBJECT_LAVA
+    return self.game_map.tile_shouldnt_walk(self.index)
 
 #==============================================================================
 
@@ -1171,15 +1279,36 @@ class GameMap(object):
   STATE_GAME_OVER = 3          ##< the game is definitely over and should no longer be updated
   
   EARTHQUAKE_DURATION = 10000
+  
+  SNAPSHOT_ATTRIBUTES = (      ##< simple map attributes that are saved in snapshots
+    "end_game_at","start_game_at","win_announced","announce_win_at","state","winner_team","game_number","max_games",
+    "earthquake_time_left","time_from_start","number_of_blocks","items_to_give_away","create_disease_cloud_at",
+    "sound_events","animation_events","bombs_added")
 
   #----------------------------------------------------------------------------
   
-  ## Initialises a new map from map_data (string) and a PlaySetup object.
+  ## Initialises a new map from map_data (string) and a PlaySetup object. All
+  #  random decisions in the game are made with a generator seeded with seed
+  #  (a random one is chosen if it's None), so the game can be reproduced.
 
-  def __init__(self, map_data, play_setup, game_number, max_games, all_items_cheat=False):
-    # make the tiles array:
-    self.danger_map_is_up_to_date = False                    # to regenerate danger map only when needed
-    self.tiles = []
+  def __init__(self, map_data, play_setup, game_number, max_games, all_items_cheat=False, seed=None):
+    if seed == None:
+      seed = random.randint(0,2 ** 31 - 1)
+    
+    self.seed = seed
+    self.random = random.Random(seed)                        ##< random number generator of the map, use this instead of the random module
+    
+    # make the tile arrays, all of them are indexed by y * MAP_WIDTH + x:
+    number_of_tiles = GameMap.MAP_WIDTH * GameMap.MAP_HEIGHT
+    
+    self.tile_kinds = bytearray(number_of_tiles)                                   ##< kind of each tile (MapTile.TILE_FLOOR etc.)
+    self.tile_items = array.array("b",[MapTile.NOTHING] * number_of_tiles)         ##< item on each tile
+    self.tile_special_objects = array.array("b",[MapTile.NOTHING] * number_of_tiles)  ##< special object on each tile
+    self.tile_destroy_flags = bytearray(number_of_tiles)                           ##< 1 for tiles to be destroyed after the flames go out
+    self.tile_flames = [[] for i in range(number_of_tiles)]                        ##< list of flames on each tile
+    self.tile_teleport_destinations = {}                                           ##< maps teleport tile indices to destination teleport coordinates
+    
+    self.tiles = []              ##< 2D list of MapTile views of the arrays, for convenience
     self.starting_positions = [(0.0,0.0) for i in range(10)] # starting position for each player
 
     map_data = map_data.replace(" ","").replace("\n","")     # get rid of white characters
@@ -1219,7 +1348,7 @@ class GameMap(object):
         column = 0
         self.tiles.append([])
 
-      tile = MapTile((column,line))
+      tile = MapTile(self,(column,line))
 
       if tile_character == "x":
         tile.kind = MapTile.TILE_BLOCK
@@ -1279,13 +1408,16 @@ class GameMap(object):
     # place items under the block tiles:
     
     for i in range(len(string_split[2])):
-      random_tile = random.choice(block_tiles)
+      random_tile = self.random.choice(block_tiles)
       random_tile.item = self.letter_to_item(string_split[2][i])
       block_tiles.remove(random_tile)
 
-    # init danger map:
+    # init danger map (it is updated incrementally, only for the bombs affected by some change):
     
-    self.danger_map = [[GameMap.SAFE_DANGER_VALUE for i in range(GameMap.MAP_WIDTH)] for j in range(GameMap.MAP_HEIGHT)]  ##< 2D array of times in ms for each square that
+    self.danger_bombs = [[[] for i in range(GameMap.MAP_WIDTH)] for j in range(GameMap.MAP_HEIGHT)]            ##< for each tile bombs whose flame would reach it
+    self.danger_examining_bombs = [[[] for i in range(GameMap.MAP_WIDTH)] for j in range(GameMap.MAP_HEIGHT)]  ##< for each tile bombs whose flame spreading depends on the tile
+    self.bomb_danger_contributions = {}       ##< cache, maps bombs to tuples (bomb tile, tiles reached by flame, tiles examined by flame)
+    self.bombs_with_outdated_danger = set()   ##< bombs whose danger contributions have to be recomputed
        
     # initialise players:
 
@@ -1316,17 +1448,29 @@ class GameMap(object):
       for player in self.players:
         item_to_give = self.letter_to_item(start_items_string[i])
         
-        player.give_item(item_to_give)
+        player.give_item(item_to_give,None,self.random)
       
       self.player_starting_items.append(item_to_give)
         
     self.bombs = []                   ##< bombs on the map
+    self.bombs_by_tiles = [[[] for i in range(GameMap.MAP_WIDTH)] for j in range(GameMap.MAP_HEIGHT)]  ##< for each tile non-flying bombs lying on it
+    self.bomb_indexed_tiles = {}      ##< maps bombs to tiles under which they are stored in bombs_by_tiles
+    self.bombs_added = 0              ##< number of bombs added to the map so far, used to number them
     self.sound_events = []            ##< list of currently happening sound event (see SoundPlayer class)
     self.animation_events = []        ##< list of animation events, tuples in format (animation_event, coordinates)
     self.items_to_give_away = []      ##< list of tuples in format (time_of_giveaway, list_of_items)
 
     self.create_disease_cloud_at = 0  ##< at what time (in ms) the disease clouds should be released
 
+    self.active_tiles = [set() for i in range(GameMap.MAP_HEIGHT)]  ##< for each row x coordinates of tiles with flames or blocks to be destroyed
+
+    self.block_layer_versions = [0 for i in range(GameMap.MAP_HEIGHT)]  ##< for each row a number that changes whenever the visible blocks in the row change, allows the renderer to cache the rows
+    self.block_layer_version_counter = 0
+
+    self.players_by_tiles = [[[] for i in range(GameMap.MAP_WIDTH)] for j in range(GameMap.MAP_HEIGHT)]  ##< for each tile players standing on it, see __update_player_grid
+    self.player_grid_tiles = []       ##< tiles of players_by_tiles that are currently non-empty
+    self.__update_player_grid()
+
   #----------------------------------------------------------------------------
 
   def get_starting_items(self):
@@ -1365,14 +1509,21 @@ class GameMap(object):
   #  how much time in ms has will pass until there will be a fire at the tile.
 
   def get_danger_value(self, tile_coordinates):
-    if not self.danger_map_is_up_to_date:
+    if len(self.bombs_with_outdated_danger) != 0:
       self.update_danger_map()
-      self.danger_map_is_up_to_date = True
     
     if not self.tile_is_withing_map(tile_coordinates):
       return 0       # never walk outside map
     
-    return self.danger_map[tile_coordinates[1]][tile_coordinates[0]]
+    result = 0 if self.tile_shouldnt_walk(tile_coordinates[1] * GameMap.MAP_WIDTH + tile_coordinates[0]) else GameMap.SAFE_DANGER_VALUE
+    
+    for bomb in self.danger_bombs[tile_coordinates[1]][tile_coordinates[0]]:
+      if bomb.has_detonator():           # detonator = bad
+        result = min(result,100)
+      else:
+        result = min(result,bomb.time_until_explosion())
+    
+    return result
 
   #----------------------------------------------------------------------------
   
@@ -1380,7 +1531,15 @@ class GameMap(object):
     if not self.tile_is_withing_map(tile_coordinates):
       return False
     
-    return self.tiles[tile_coordinates[1]][tile_coordinates[0]].special_object == MapTile.SPECIAL_OBJECT_LAVA
+    return self.tile_special_objects[tile_coordinates[1] * GameMap.MAP_WIDTH + tile_coordinates[0]] == MapTile.SPECIAL_OBJECT_LAVA
+
+  #----------------------------------------------------------------------------
+  
+  ## Checks whether a player shouldn't walk on tile with given index (see
+  #  tile arrays) without considering bombs.
+  
+  def tile_shouldnt_walk(self, tile_index):
+    return self.tile_kinds[tile_index] != MapTile.TILE_FLOOR or len(self.tile_flames[tile_index]) >= 1 or self.tile_special_objects[tile_index] == MapTile.SPECIAL_OBJECT_LAVA
 
   #----------------------------------------------------------------------------
   
@@ -1388,24 +1547,31 @@ class GameMap(object):
   #  are spread randomly on the map floor tiles after a while.
   
   def give_away_items(self, items):
-    self.items_to_give_away.append((pygame.time.get_ticks() + GameMap.GIVE_AWAY_DELAY,items))
+    self.items_to_give_away.append((self.time_from_start + GameMap.GIVE_AWAY_DELAY,items))
 
   #----------------------------------------------------------------------------
   
-  def update_danger_map(self):
-    # reset the map:
-    self.danger_map = [map(lambda tile: 0 if tile.shouldnt_walk() else GameMap.SAFE_DANGER_VALUE, tile_row) for tile_row in self.tiles]
+  ## Recomputes the cached danger contributions (tiles reached by the flame)
+  #  of the bombs that have been affected by some change since the last update.
 
-    for bomb in self.bombs:
-      bomb_tile = bomb.get_tile_position()
+  def update_danger_map(self):
+    for bomb in self.bombs_with_outdated_danger:
+      if bomb in self.bomb_danger_contributions:     # remove the old contribution
+        contribution = self.bomb_danger_contributions.pop(bomb)
+        
+        for tile in contribution[1]:
+          self.danger_bombs[tile[1]][tile[0]].remove(bomb)
+          
+        for tile in contribution[2]:
+          self.danger_examining_bombs[tile[1]][tile[0]].remove(bomb)
       
-      time_until_explosion = bomb.time_until_explosion()
+      if bomb.has_exploded:
+        continue
       
-      if bomb.has_detonator():           # detonator = bad
-        time_until_explosion = 100
+      bomb_tile = bomb.get_tile_position()
+      reached_tiles = [bomb_tile]
+      examined_tiles = []
       
-      self.danger_map[bomb_tile[1]][bomb_tile[0]] = min(self.danger_map[bomb_tile[1]][bomb_tile[0]],time_until_explosion)
-
                          # up                              right                            down                             left
       position         = [[bomb_tile[0],bomb_tile[1] - 1], [bomb_tile[0] + 1,bomb_tile[1]], [bomb_tile[0],bomb_tile[1] + 1], [bomb_tile[0] - 1,bomb_tile[1]]]
       flame_stop       = [False,                           False,                           False,                           False]
@@ -1415,16 +1581,83 @@ class GameMap(object):
         for direction in (0,1,2,3):
           if flame_stop[direction]:
             continue
-        
-          if not self.tile_is_walkable(position[direction]) or not self.tile_is_withing_map(position[direction]):
+          
+          current_tile = (position[direction][0],position[direction][1])
+          
+          if not self.tile_is_withing_map(current_tile):
             flame_stop[direction] = True
             continue
           
-          current_tile = position[direction]
+          examined_tiles.append(current_tile)
+          
+          if not self.tile_is_walkable(current_tile):
+            flame_stop[direction] = True
+            continue
           
-          self.danger_map[current_tile[1]][current_tile[0]] = min(self.danger_map[current_tile[1]][current_tile[0]],time_until_explosion)
+          reached_tiles.append(current_tile)
           position[direction][0] += tile_increment[direction][0] 
           position[direction][1] += tile_increment[direction][1]
+      
+      for tile in reached_tiles:
+        self.danger_bombs[tile[1]][tile[0]].append(bomb)
+      
+      for tile in examined_tiles:
+        self.danger_examining_bombs[tile[1]][tile[0]].append(bomb)
+      
+      self.bomb_danger_contributions[bomb] = (bomb_tile,reached_tiles,examined_tiles)
+      
+    self.bombs_with_outdated_danger = set()
+
+  #----------------------------------------------------------------------------
+
+  ## Marks the danger contributions of the bombs whose flame spreading depends
+  #  on given tile as outdated, must be called when the tile's walkability
+  #  changes.
+
+  def __danger_tile_changed(self, tile_coordinates):
+    if self.tile_is_withing_map(tile_coordinates):
+      self.bombs_with_outdated_danger.update(self.danger_examining_bombs[tile_coordinates[1]][tile_coordinates[0]])
+
+  #----------------------------------------------------------------------------
+
+  ## Marks the blocks in given row as changed for the renderer (see
+  #  get_block_layer_version). The versions only ever grow, so that a cached
+  #  row can never be mistaken for a different one, even after restore().
+
+  def __block_layer_changed(self, row):
+    self.block_layer_version_counter += 1
+    self.block_layer_versions[row] = self.block_layer_version_counter
+
+  #----------------------------------------------------------------------------
+
+  ## Returns a number that changes whenever the visible blocks or walls in
+  #  given row change (a block being destroyed is not visible).
+
+  def get_block_layer_version(self, row):
+    return self.block_layer_versions[row]
+
+  #----------------------------------------------------------------------------
+
+  ## Must be called when a bomb changes its tile or starts or stops flying so
+  #  that the map can keep its bomb related data up to date. Is also called
+  #  when the bomb is added or removed.
+
+  def bomb_moved(self, bomb):
+    if bomb in self.bomb_indexed_tiles:
+      tile = self.bomb_indexed_tiles.pop(bomb)
+      self.bombs_by_tiles[tile[1]][tile[0]].remove(bomb)
+    
+    tile = bomb.get_tile_position()
+    
+    if not bomb.has_exploded and bomb.movement != Bomb.BOMB_FLYING and self.tile_is_withing_map(tile):
+      self.bombs_by_tiles[tile[1]][tile[0]].append(bomb)
+      self.bomb_indexed_tiles[bomb] = tile
+    
+    self.bombs_with_outdated_danger.add(bomb)
+    self.__danger_tile_changed(bomb.get_tile_position())
+    
+    if bomb in self.bomb_danger_contributions:
+      self.__danger_tile_changed(self.bomb_danger_contributions[bomb][0])
 
   #----------------------------------------------------------------------------
           
@@ -1486,7 +1719,7 @@ class GameMap(object):
     if not self.tile_is_withing_map(tile_coordinates):
       return False     # coordinates outside the map
     
-    return len(self.tiles[tile_coordinates[1]][tile_coordinates[0]].flames) >= 1
+    return len(self.tile_flames[tile_coordinates[1] * GameMap.MAP_WIDTH + tile_coordinates[0]]) >= 1
 
   #----------------------------------------------------------------------------
 
@@ -1496,34 +1729,47 @@ class GameMap(object):
     if not self.tile_is_withing_map(tile_coordinates):
       return False     # coordinates outside the map
     
-    return self.tiles[tile_coordinates[1]][tile_coordinates[0]].special_object in (MapTile.SPECIAL_OBJECT_TELEPORT_A,MapTile.SPECIAL_OBJECT_TELEPORT_B)
+    return self.tile_special_objects[tile_coordinates[1] * GameMap.MAP_WIDTH + tile_coordinates[0]] in (MapTile.SPECIAL_OBJECT_TELEPORT_A,MapTile.SPECIAL_OBJECT_TELEPORT_B)
 
   #----------------------------------------------------------------------------
 
   def bomb_on_tile(self, tile_coordinates):
-    bombs = self.bombs_on_tile(tile_coordinates)
+    tile_coordinates = Positionable.position_to_tile(tile_coordinates)
     
-    if len(bombs) > 0:
+    if not self.tile_is_withing_map(tile_coordinates):
+      return None
+    
+    bombs = self.bombs_by_tiles[tile_coordinates[1]][tile_coordinates[0]]
+    
+    if len(bombs) == 0:
+      return None
+    elif len(bombs) == 1:
       return bombs[0]
     
-    return None
+    return self.bombs_on_tile(tile_coordinates)[0]
 
   #----------------------------------------------------------------------------
 
   ## Checks if there is a bomb at given tile (coordinates may be float or int).
 
   def tile_has_bomb(self, tile_coordinates):
-    return self.bomb_on_tile(tile_coordinates) != None
+    tile_coordinates = Positionable.position_to_tile(tile_coordinates)
+    
+    if not self.tile_is_withing_map(tile_coordinates):
+      return False
+    
+    return len(self.bombs_by_tiles[tile_coordinates[1]][tile_coordinates[0]]) != 0
 
   #----------------------------------------------------------------------------
 
   def get_players_at_tile(self, tile_coordinates):
+    if not self.tile_is_withing_map(tile_coordinates):
+      return []
+    
     result = []
     
-    for player in self.players:
-      player_tile_position = player.get_tile_position()
-
-      if not player.is_dead() and not player.is_in_air() and player_tile_position[0] == tile_coordinates[0] and player_tile_position[1] == tile_coordinates[1]:
+    for player in self.players_by_tiles[tile_coordinates[1]][tile_coordinates[0]]:
+      if not player.is_dead() and not player.is_in_air():
         result.append(player)
     
     return result
@@ -1535,6 +1781,28 @@ class GameMap(object):
 
   #----------------------------------------------------------------------------
 
+  ## Puts the living players into the occupancy grid by their current tile
+  #  positions. Players move a lot, so instead of tracking each move the grid
+  #  is rebuilt once per update (and when the map itself moves a player).
+
+  def __update_player_grid(self):
+    for tile in self.player_grid_tiles:
+      self.players_by_tiles[tile[1]][tile[0]] = []
+      
+    self.player_grid_tiles = []
+    
+    for player in self.players:
+      if player.is_dead():
+        continue
+      
+      tile = player.get_tile_position()
+      
+      if self.tile_is_withing_map(tile):
+        self.players_by_tiles[tile[1]][tile[0]].append(player)
+        self.player_grid_tiles.append(tile)
+
+  #----------------------------------------------------------------------------
+
   ## Checks if given tile coordinates are within the map boundaries.
 
   def tile_is_withing_map(self, tile_coordinates):
@@ -1546,8 +1814,8 @@ class GameMap(object):
     if not self.tile_is_withing_map(tile_coordinates):
       return False
     
-    tile = self.tiles[tile_coordinates[1]][tile_coordinates[0]]
-    return self.tile_is_withing_map(tile_coordinates) and (self.tiles[tile_coordinates[1]][tile_coordinates[0]].kind == MapTile.TILE_FLOOR or tile.to_be_destroyed) and not self.tile_has_bomb(tile_coordinates)
+    tile_index = tile_coordinates[1] * GameMap.MAP_WIDTH + tile_coordinates[0]
+    return (self.tile_kinds[tile_index] == MapTile.TILE_FLOOR or self.tile_destroy_flags[tile_index] != 0) and not self.tile_has_bomb(tile_coordinates)
 
   #----------------------------------------------------------------------------
 
@@ -1579,18 +1847,21 @@ class GameMap(object):
 
   #----------------------------------------------------------------------------
 
+  ## Returns a list of (non-flying) bombs on given tile (coordinates may be
+  #  float or int), the list is a copy and can be modified.
+
   def bombs_on_tile(self, tile_coordinates):
-    result = []
-    
     tile_coordinates = Positionable.position_to_tile(tile_coordinates)
     
-    for bomb in self.bombs:
-      bomb_tile_position = bomb.get_tile_position()
-
-      if bomb.movement != Bomb.BOMB_FLYING and bomb_tile_position[0] == tile_coordinates[0] and bomb_tile_position[1] == tile_coordinates[1]:
-        result.append(bomb)
+    if not self.tile_is_withing_map(tile_coordinates):
+      return []
+    
+    bombs = self.bombs_by_tiles[tile_coordinates[1]][tile_coordinates[0]]
+    
+    if len(bombs) > 1:       # keep the order in which the bombs are on the map
+      return sorted(bombs,key=self.bombs.index)
       
-    return result
+    return list(bombs)
 
   #----------------------------------------------------------------------------
 
@@ -1613,7 +1884,8 @@ class GameMap(object):
     new_flame.player = bomb.player
     new_flame.direction = "all"
     
-    self.tiles[bomb_position[1]][bomb_position[0]].flames.append(new_flame)
+    self.tile_flames[bomb_position[1] * GameMap.MAP_WIDTH + bomb_position[0]].append(new_flame)
+    self.active_tiles[bomb_position[1]].add(bomb_position[0])
     
     # information relevant to flame spreading in each direction:
     
@@ -1642,20 +1914,23 @@ class GameMap(object):
             # flame is inside the map here          
         
             if goes_horizontaly[direction]:
-              tile_for_flame = self.tiles[bomb_position[1]][axis_position[direction]]
+              flame_coordinates = (axis_position[direction],bomb_position[1])
             else:
-              tile_for_flame = self.tiles[axis_position[direction]][bomb_position[0]]
+              flame_coordinates = (bomb_position[0],axis_position[direction])
+              
+            flame_tile_index = flame_coordinates[1] * GameMap.MAP_WIDTH + flame_coordinates[0]
         
-            if tile_for_flame.kind == MapTile.TILE_WALL:
+            if self.tile_kinds[flame_tile_index] == MapTile.TILE_WALL:
               flame_stop[direction] = True
             else:
               new_flame2 = copy.copy(new_flame)
               new_flame2.direction = "horizontal" if goes_horizontaly[direction] else "vertical"
-              tile_for_flame.flames.append(new_flame2)
+              self.tile_flames[flame_tile_index].append(new_flame2)
+              self.active_tiles[flame_coordinates[1]].add(flame_coordinates[0])
             
               previous_flame[direction] = new_flame2
             
-              if tile_for_flame.kind == MapTile.TILE_BLOCK:
+              if self.tile_kinds[flame_tile_index] == MapTile.TILE_BLOCK:
                 flame_stop[direction] = True
           else:
             flame_stop[direction] = True
@@ -1666,27 +1941,28 @@ class GameMap(object):
    
     if bomb in self.bombs:
       self.bombs.remove(bomb)
+      self.bomb_moved(bomb)
 
   #----------------------------------------------------------------------------
 
   def spread_items(self, items):
-    possible_tiles = []
+    possible_tiles = []        # tile indices
     
     for y in range(GameMap.MAP_HEIGHT):
       for x in range(GameMap.MAP_WIDTH):
-        tile = self.tiles[y][x]
+        tile_index = y * GameMap.MAP_WIDTH + x
         
-        if tile.kind == MapTile.TILE_FLOOR and tile.special_object == None and tile.item == None and not self.tile_has_player((x,y)):
-          possible_tiles.append(tile)
+        if self.tile_kinds[tile_index] == MapTile.TILE_FLOOR and self.tile_special_objects[tile_index] == MapTile.NOTHING and self.tile_items[tile_index] == MapTile.NOTHING and not self.tile_has_player((x,y)):
+          possible_tiles.append(tile_index)
           
     for item in items:
       if len(possible_tiles) == 0:
         break                              # no more tiles to place items on => end
       
-      tile = random.choice(possible_tiles)
-      tile.item = item
+      tile_index = self.random.choice(possible_tiles)
+      self.tile_items[tile_index] = item
       
-      possible_tiles.remove(tile)
+      possible_tiles.remove(tile_index)
 
   #----------------------------------------------------------------------------
 
@@ -1698,6 +1974,7 @@ class GameMap(object):
       
       if bomb.has_exploded:       # just in case
         self.bombs.remove(bomb)
+        self.bomb_moved(bomb)
         continue
       
       bomb.time_of_existence += dt
@@ -1708,7 +1985,7 @@ class GameMap(object):
       if bomb.movement != Bomb.BOMB_FLYING and bomb.time_of_existence > bomb.explodes_in + bomb.detonator_time: # bomb explodes
         self.bomb_explodes(bomb)
         continue
-      elif bomb.movement != Bomb.BOMB_FLYING and self.tiles[bomb_tile[1]][bomb_tile[0]].special_object == MapTile.SPECIAL_OBJECT_LAVA and bomb.is_near_tile_center():
+      elif bomb.movement != Bomb.BOMB_FLYING and self.tile_has_lava(bomb_tile) and bomb.is_near_tile_center():
         self.bomb_explodes(bomb)
         continue
       else:
@@ -1728,10 +2005,12 @@ class GameMap(object):
               bomb.send_flying(destination_tile)
             else:        # bomb lands
               bomb.movement = Bomb.BOMB_NO_MOVEMENT
-              self.get_tile_at(bomb_tile).item = None        
+              self.tile_items[bomb_tile[1] * GameMap.MAP_WIDTH + bomb_tile[0]] = MapTile.NOTHING
+              
+            self.bomb_moved(bomb)
         else:            # bomb rolling          
           if bomb.is_near_tile_center():
-            object_at_tile = self.tiles[bomb_tile[1]][bomb_tile[0]].special_object
+            object_at_tile = self.tile_special_objects[bomb_tile[1] * GameMap.MAP_WIDTH + bomb_tile[0]]
           
             redirected = False
           
@@ -1755,8 +2034,7 @@ class GameMap(object):
             if redirected:
               bomb_position = bomb.get_position()
               
-          if self.tiles[bomb_tile[1]][bomb_tile[0]].item != None:   # rolling bomb destroys items
-            self.tiles[bomb_tile[1]][bomb_tile[0]].item = None
+          self.tile_items[bomb_tile[1] * GameMap.MAP_WIDTH + bomb_tile[0]] = MapTile.NOTHING   # rolling bomb destroys items
         
           bomb_position_within_tile = (bomb_position[0] % 1,bomb_position[1] % 1) 
           check_collision = False
@@ -1800,6 +2078,9 @@ class GameMap(object):
               check_collision = True
               forward_tile = (bomb_tile[0] - 1,bomb_tile[1])
 
+          if bomb.get_tile_position() != bomb_tile:
+            self.bomb_moved(bomb)
+
           if check_collision and (not self.tile_is_walkable(forward_tile) or self.tile_has_player(forward_tile) or self.tile_has_teleport(forward_tile)):
             bomb.move_to_tile_center()          
           
@@ -1813,7 +2094,7 @@ class GameMap(object):
   #----------------------------------------------------------------------------
 
   def __update_players(self, dt, immortal_player_numbers):
-    time_now = pygame.time.get_ticks()
+    time_now = self.time_from_start
     release_disease_cloud = False
     
     if time_now > self.create_disease_cloud_at:
@@ -1833,13 +2114,13 @@ class GameMap(object):
         self.game_is_over = False
         
       player_tile_position = player.get_tile_position()
-      player_tile = self.tiles[player_tile_position[1]][player_tile_position[0]]
+      player_tile_index = player_tile_position[1] * GameMap.MAP_WIDTH + player_tile_position[0]
       
-      if player.get_state() != Player.STATE_IN_AIR and player.get_state != Player.STATE_TELEPORTING and (self.tile_has_flame(player_tile.coordinates) or self.tile_has_lava(player_tile.coordinates)):
+      if player.get_state() != Player.STATE_IN_AIR and player.get_state != Player.STATE_TELEPORTING and (self.tile_has_flame(player_tile_position) or self.tile_has_lava(player_tile_position)):
 
         # if player immortality cheat isn't activated        
         if not (player.get_number() in immortal_player_numbers):
-          flames = self.get_tile_at(player_tile.coordinates).flames
+          flames = self.tile_flames[player_tile_index]
         
           # assign kill counts
         
@@ -1850,9 +2131,10 @@ class GameMap(object):
           player.kill(self)
           continue
       
-      if player_tile.item != None:
-        player.give_item(player_tile.item,self)
-        player_tile.item = None
+      if self.tile_items[player_tile_index] != MapTile.NOTHING:
+        player.give_item(self.tile_items[player_tile_index],self)
+        self.tile_items[player_tile_index] = MapTile.NOTHING
+        self.__update_player_grid()      # the item may have switched players' positions
       
       if player.is_in_air():
         if player.get_state_time() > Player.JUMP_DURATION / 2:  # jump to destination tile in the middle of the flight
@@ -1860,9 +2142,12 @@ class GameMap(object):
       elif player.is_teleporting():
         if player.get_state_time() > Player.TELEPORT_DURATION / 2:
           player.move_to_tile_center(player.get_teleport_destination())
-      elif player_tile.special_object == MapTile.SPECIAL_OBJECT_TRAMPOLINE and player.is_near_tile_center():
+          
+          if player.get_tile_position() != player_tile_position:
+            self.__update_player_grid()
+      elif self.tile_special_objects[player_tile_index] == MapTile.SPECIAL_OBJECT_TRAMPOLINE and player.is_near_tile_center():
         player.send_to_air(self)
-      elif (player_tile.special_object == MapTile.SPECIAL_OBJECT_TELEPORT_A or player_tile.special_object == MapTile.SPECIAL_OBJECT_TELEPORT_B) and player.is_near_tile_center():
+      elif (self.tile_special_objects[player_tile_index] == MapTile.SPECIAL_OBJECT_TELEPORT_A or self.tile_special_objects[player_tile_index] == MapTile.SPECIAL_OBJECT_TELEPORT_B) and player.is_near_tile_center():
         player.teleport(self)
       elif player.get_disease() != Player.DISEASE_NONE:
         players_at_tile = self.get_players_at_tile(player_tile_position)
@@ -1874,7 +2159,7 @@ class GameMap(object):
             transmitted = True
             player_at_tile.set_disease(player.get_disease(),player.get_disease_time())  # transmit disease
           
-        if transmitted and random.randint(0,2) == 0:
+        if transmitted and self.random.randint(0,2) == 0:
           self.add_sound_event(SoundPlayer.SOUND_EVENT_GO_AWAY)
 
   #----------------------------------------------------------------------------
@@ -1884,7 +2169,7 @@ class GameMap(object):
   def update(self, dt, immortal_player_numbers=[]):
     self.time_from_start += dt
     
-    self.danger_map_is_up_to_date = False    # reset this each frame
+    self.__update_player_grid()    # players have moved since the last update
     
     i = 0
     
@@ -1903,42 +2188,61 @@ class GameMap(object):
 
     self.__update_bombs(dt)
 
-    for line in self.tiles:
-      for tile in line:
-        if tile.to_be_destroyed and tile.kind == MapTile.TILE_BLOCK and not self.tile_has_flame(tile.coordinates):
-          tile.kind = MapTile.TILE_FLOOR
+    for y in range(GameMap.MAP_HEIGHT):      # only go through the tiles with flames or blocks being destroyed
+      active_row = self.active_tiles[y]
+      
+      if len(active_row) == 0:
+        continue
+      
+      for x in range(GameMap.MAP_WIDTH):     # flames added during this loop are also checked, like when going through all tiles
+        if not x in active_row:
+          continue
+        
+        tile_index = y * GameMap.MAP_WIDTH + x
+        tile_flames = self.tile_flames[tile_index]
+      
+        if self.tile_destroy_flags[tile_index] != 0 and self.tile_kinds[tile_index] == MapTile.TILE_BLOCK and len(tile_flames) == 0:
+          self.tile_kinds[tile_index] = MapTile.TILE_FLOOR
           self.number_of_blocks -= 1
-          tile.to_be_destroyed = False
+          self.tile_destroy_flags[tile_index] = 0
+          self.__block_layer_changed(y)
         
         i = 0
         
         while True:
-          if i >= len(tile.flames):
+          if i >= len(tile_flames):
             break
           
-          if tile.kind == MapTile.TILE_BLOCK:  # flame on a block tile -> destroy the block
-            tile.to_be_destroyed = True
-          elif tile.kind == MapTile.TILE_FLOOR and tile.item != None:
-            tile.item = None                   # flame destroys the item
+          if self.tile_kinds[tile_index] == MapTile.TILE_BLOCK:  # flame on a block tile -> destroy the block
+            if self.tile_destroy_flags[tile_index] == 0:
+              self.tile_destroy_flags[tile_index] = 1
+              self.__danger_tile_changed((x,y))   # block about to be destroyed is walkable
+              self.__block_layer_changed(y)       # and isn't drawn anymore
+          elif self.tile_kinds[tile_index] == MapTile.TILE_FLOOR:
+            self.tile_items[tile_index] = MapTile.NOTHING   # flame destroys the item
           
-          bombs_inside_flame = self.bombs_on_tile(tile.coordinates)
+          bombs_inside_flame = self.bombs_on_tile((x,y))
           
           for bomb in bombs_inside_flame:      # bomb inside flame -> detonate it
             self.bomb_explodes(bomb)
           
-          flame = tile.flames[i]
+          flame = tile_flames[i]
           
           flame.time_to_burnout -= dt
           
           if flame.time_to_burnout < 0:
-            tile.flames.remove(flame)
+            tile_flames.remove(flame)
       
           i += 1
+          
+        if len(tile_flames) == 0 and self.tile_destroy_flags[tile_index] == 0:
+          active_row.discard(x)
     
     self.game_is_over = True
     self.winning_color = -1
 
     self.__update_players(dt,immortal_player_numbers)
+    self.__update_player_grid()
           
     if self.state == GameMap.STATE_WAITING_TO_PLAY:  
       if self.time_from_start >= self.start_game_at:
@@ -1970,7 +2274,10 @@ class GameMap(object):
   #----------------------------------------------------------------------------
     
   def add_bomb(self, bomb):
+    bomb.number = self.bombs_added
+    self.bombs_added += 1
     self.bombs.append(bomb)
+    self.bomb_moved(bomb)
 
   #----------------------------------------------------------------------------
 
@@ -2001,14 +2308,163 @@ class GameMap(object):
 
   #----------------------------------------------------------------------------
 
+  def get_seed(self):
+    return self.seed
+
+  #----------------------------------------------------------------------------
+
+  ## Saves the whole simulation state of the map (tiles, players, bombs,
+  #  flames, ...) into a compact string that can later be passed to restore().
+  
+  def snapshot(self):
+    bomb_indices = {}
+    
+    for i in range(len(self.bombs)):
+      bomb_indices[self.bombs[i]] = i
+    
+    players = []
+    
+    for player in self.players:
+      player_state = player.__dict__.copy()
+      player_state["detonator_bombs"] = [bomb_indices.get(bomb,-1) for bomb in player.detonator_bombs]   # -1 = already exploded
+      players.append(tuple(sorted(player_state.items())))     # sorted so that same states give same snapshots
+      
+    bombs = []
+    
+    for bomb in self.bombs:
+      bomb_state = bomb.__dict__.copy()
+      bomb_state["player"] = bomb.player.get_number()
+      bomb_state["flight_info"] = tuple(sorted(bomb.flight_info.__dict__.items()))
+      bombs.append(tuple(sorted(bomb_state.items())))
+      
+    flames = []
+    
+    for tile_index in range(len(self.tile_flames)):
+      for flame in self.tile_flames[tile_index]:
+        flames.append((tile_index,flame.player.get_number(),flame.time_to_burnout,flame.direction))
+    
+    map_state = tuple([getattr(self,attribute_name) for attribute_name in GameMap.SNAPSHOT_ATTRIBUTES])
+    
+    return marshal.dumps((
+      map_state,
+      bytes(self.tile_kinds),
+      self.tile_items.tostring(),
+      self.tile_special_objects.tostring(),
+      bytes(self.tile_destroy_flags),
+      players,
+      bombs,
+      flames,
+      self.random.getstate()))
+
+  #----------------------------------------------------------------------------
+
+  ## Restores the map state from a string made by snapshot() of this map (or
+  #  a map made from the same map data and play setup). The Player objects
+  #  stay the same (so that for example AIs can keep referencing them), so do
+  #  the Bomb objects of the bombs that are in the map both before and after
+  #  (identified by their numbers), other bombs and flames are made anew.
+  #  All the block layer versions change, unless
+  #  keep_unchanged_rows is True, in which case only the rows whose blocks
+  #  look different do (for restoring snapshots of the same game repeatedly).
+  
+  def restore(self, snapshot, keep_unchanged_rows = False):
+    map_state, tile_kinds, tile_items, tile_special_objects, tile_destroy_flags, players, bombs, flames, random_state = marshal.loads(snapshot)
+    
+    previous_tile_kinds = bytes(self.tile_kinds)
+    previous_tile_destroy_flags = bytes(self.tile_destroy_flags)
+    
+    self.random.setstate(random_state)
+    
+    for i in range(len(GameMap.SNAPSHOT_ATTRIBUTES)):
+      setattr(self,GameMap.SNAPSHOT_ATTRIBUTES[i],map_state[i])
+      
+    self.tile_kinds[:] = tile_kinds
+    self.tile_items = array.array("b",tile_items)
+    self.tile_special_objects = array.array("b",tile_special_objects)
+    self.tile_destroy_flags[:] = tile_destroy_flags
+    
+    bombs_by_numbers = dict((bomb.number,bomb) for bomb in self.bombs)
+    self.bombs = []
+    
+    for bomb_state in bombs:
+      bomb_state = dict(bomb_state)
+      new_bomb = bombs_by_numbers.get(bomb_state["number"],None)
+      
+      if new_bomb == None:                 # bomb not in the map, make a new one
+        new_bomb = Bomb(self.players_by_numbers[bomb_state["player"]])
+      
+      flight_info = dict(bomb_state["flight_info"])
+      bomb_state["player"] = self.players_by_numbers[bomb_state["player"]]
+      bomb_state["flight_info"] = new_bomb.flight_info
+      new_bomb.__dict__.update(bomb_state)
+      new_bomb.flight_info.__dict__.update(flight_info)
+      self.bombs.append(new_bomb)
+    
+    for i in range(len(self.players)):
+      player = self.players[i]
+      player_state = dict(players[i])
+      detonator_bombs = []
+      
+      for bomb_index in player_state["detonator_bombs"]:
+        if bomb_index >= 0:
+          detonator_bombs.append(self.bombs[bomb_index])
+        else:
+          exploded_bomb = Bomb(player)     # just a placeholder for a bomb that has already exploded
+          exploded_bomb.has_exploded = True
+          detonator_bombs.append(exploded_bomb)
+      
+      player_state["detonator_bombs"] = detonator_bombs
+      player.__dict__.clear()
+      player.__dict__.update(player_state)
+    
+    for tile_flames in self.tile_flames:
+      del tile_flames[:]
+      
+    self.active_tiles = [set() for i in range(GameMap.MAP_HEIGHT)]
+    
+    for flame_state in flames:
+      new_flame = Flame()
+      new_flame.player = self.players_by_numbers[flame_state[1]]
+      new_flame.time_to_burnout = flame_state[2]
+      new_flame.direction = flame_state[3]
+      self.tile_flames[flame_state[0]].append(new_flame)
+    
+    for tile_index in range(len(self.tile_flames)):
+      if len(self.tile_flames[tile_index]) != 0 or self.tile_destroy_flags[tile_index] != 0:
+        self.active_tiles[tile_index / GameMap.MAP_WIDTH].add(tile_index % GameMap.MAP_WIDTH)
+    
+    # rebuild the helper structures:
+    
+    self.bombs_by_tiles = [[[] for i in range(GameMap.MAP_WIDTH)] for j in range(GameMap.MAP_HEIGHT)]
+    self.bomb_indexed_tiles = {}
+    self.danger_bombs = [[[] for i in range(GameMap.MAP_WIDTH)] for j in range(GameMap.MAP_HEIGHT)]
+    self.danger_examining_bombs = [[[] for i in range(GameMap.MAP_WIDTH)] for j in range(GameMap.MAP_HEIGHT)]
+    self.bomb_danger_contributions = {}
+    self.bombs_with_outdated_danger = set()
+    
+    for bomb in self.bombs:
+      self.bomb_moved(bomb)
+    
+    self.__update_player_grid()
+    
+    for y in range(GameMap.MAP_HEIGHT):
+      row = slice(y * GameMap.MAP_WIDTH,(y + 1) * GameMap.MAP_WIDTH)
+      
+      if not keep_unchanged_rows or previous_tile_kinds[row] != tile_kinds[row] or previous_tile_destroy_flags[row] != tile_destroy_flags[row]:
+        self.__block_layer_changed(y)
+
+  #----------------------------------------------------------------------------
+
   def __str__(self):
     result = ""
 
-    for line in self.tiles:
-      for tile in line:
-        if tile.kind == MapTile.TILE_FLOOR:
+    for y in range(GameMap.MAP_HEIGHT):
+      for x in range(GameMap.MAP_WIDTH):
+        tile_kind = self.tile_kinds[y * GameMap.MAP_WIDTH + x]
+        
+        if tile_kind == MapTile.TILE_FLOOR:
           result += " "
-        elif tile.kind == MapTile.TILE_BLOCK:
+        elif tile_kind == MapTile.TILE_BLOCK:
           result += "x"
         else:
           result += "#"
@@ -2574,28 +3030,30 @@ class SoundPlayer(object):
 
   #----------------------------------------------------------------------------
   
-  def __init__(self):
+  def __init__(self, asset_loader = None):
     self.sound_volume = 0.5
     self.music_volume = 0.5
     
+    self.asset_loader = asset_loader   ##< if not None, the sounds are decoded in its background threads
+    
     self.sounds = {}
-    self.sounds[SoundPlayer.SOUND_EVENT_EXPLOSION] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"explosion.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_BOMB_PUT] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"bomb.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_WALK] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"footsteps.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_KICK] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"kick.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_SPRING] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"spring.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_DIARRHEA] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"fart.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_SLOW] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"slow.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_DISEASE] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"disease.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_CLICK] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"click.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_THROW] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"throw.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_TRAMPOLINE] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"trampoline.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_TELEPORT] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"teleport.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_DEATH] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"death.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_GO_AWAY] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"go_away.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_GO] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"go.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_EARTHQUAKE] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"earthquake.wav"))
-    self.sounds[SoundPlayer.SOUND_EVENT_CONFIRM] = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,"confirm.wav"))
+    self.__load_sound(SoundPlayer.SOUND_EVENT_EXPLOSION,"explosion.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_BOMB_PUT,"bomb.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_WALK,"footsteps.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_KICK,"kick.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_SPRING,"spring.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_DIARRHEA,"fart.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_SLOW,"slow.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_DISEASE,"disease.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_CLICK,"click.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_THROW,"throw.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_TRAMPOLINE,"trampoline.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_TELEPORT,"teleport.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_DEATH,"death.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_GO_AWAY,"go_away.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_GO,"go.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_EARTHQUAKE,"earthquake.wav")
+    self.__load_sound(SoundPlayer.SOUND_EVENT_CONFIRM,"confirm.wav")
     
     self.music_filenames = [
       "music_broke_for_free_caught_in_the_beat_remix.wav",
@@ -2614,6 +3072,25 @@ class SoundPlayer(object):
     self.kick_last_played_time = 0
 
   #----------------------------------------------------------------------------
+
+  ## Loads the sound of given sound event from given file in the resource
+  #  directory, in a background thread if the sound player has an asset
+  #  loader (the sound is then available after the loader's wait()).
+
+  def __load_sound(self, sound_event, file_name):
+    if self.asset_loader != None:
+      self.asset_loader.submit(self.__decode_sound,(sound_event,file_name))
+    else:
+      self.__decode_sound(sound_event,file_name)
+
+  #----------------------------------------------------------------------------
+
+  def __decode_sound(self, sound_event, file_name):
+    sound = pygame.mixer.Sound(os.path.join(Game.RESOURCE_PATH,file_name))
+    sound.set_volume(self.sound_volume)
+    self.sounds[sound_event] = sound
+
+  #----------------------------------------------------------------------------
      
   def play_once(self, filename):
     sound = pygame.mixer.Sound(filename)
@@ -2723,52 +3200,292 @@ class SoundPlayer(object):
     
 #==============================================================================
 
-class Animation(object):
+## Loads each image file only once and keeps it converted to the display pixel
+#  format (blitting unconverted surfaces is much slower, because each blit has
+#  to convert the pixels).
+
+class ImageCache(object):
 
   #----------------------------------------------------------------------------
 
-  def __init__(self, filename_prefix, start_number, end_number, filename_postfix, framerate = 10):
-    self.framerate = framerate
-    self.frame_time = 1000 / self.framerate
-    
-    self.frame_images = []
-    
-    for i in range(start_number,end_number + 1):
-      self.frame_images.append(pygame.image.load(filename_prefix + str(i) + filename_postfix))
-      
-    self.playing_instances = []   ##< A set of playing animations, it is a list of tuples in
-                                  #  a format: (pixel_coordinates, started_playing).     
+  def __init__(self):
+    self.loaded_images = {}       ##< images as loaded from the files, keys are the file paths
+    self.converted_images = {}    ##< the same images converted to the display format
 
   #----------------------------------------------------------------------------
 
-  def play(self, coordinates):
-    # convert center coordinates to top left coordinates:
-    
-    top_left = (coordinates[0] - self.frame_images[0].get_size()[0] / 2,coordinates[1] - self.frame_images[0].get_size()[1] / 2)
-    self.playing_instances.append((top_left,pygame.time.get_ticks()))
+  ## Converts given surface to the current display pixel format (keeping its
+  #  transparency), if there is no display yet, the surface is returned as is.
 
-  #----------------------------------------------------------------------------
-    
-  def draw(self, surface):
-    i = 0
+  @staticmethod
+  def convert_surface(surface):
+    if pygame.display.get_surface() == None:
+      return surface
     
-    time_now = pygame.time.get_ticks()
+    if surface.get_flags() & pygame.SRCALPHA:
+      return surface.convert_alpha()
     
-    while True:
-      if i >= len(self.playing_instances):
-        break
-      
-      playing_instance = self.playing_instances[i]
+    return surface.convert()
+
+  #----------------------------------------------------------------------------
+
+  ## Returns the image from given file as loaded from the file (not converted
+  #  to the display format), loading it if it hasn't been loaded yet. Unlike
+  #  load() this can be called from the background loading threads (see
+  #  AssetLoader). The returned surface is shared, so it mustn't be modified.
+
+  def decode(self, file_path):
+    if not file_path in self.loaded_images:
+      debug_log("loading image " + file_path)
+      self.loaded_images[file_path] = pygame.image.load(file_path)
       
-      frame = int((time_now - playing_instance[1]) / self.frame_time)
+    return self.loaded_images[file_path]
+
+  #----------------------------------------------------------------------------
+
+  ## Returns the image from given file, loading it if it hasn't been loaded
+  #  yet. The returned surface is shared, so it mustn't be modified.
+
+  def load(self, file_path):
+    if not file_path in self.converted_images:
+      image = self.decode(file_path)
       
-      if frame >= len(self.frame_images):
-        self.playing_instances.remove(playing_instance)
-        continue
-        
-      surface.blit(self.frame_images[frame],playing_instance[0])
+      if pygame.display.get_surface() == None:
+        return image
       
-      i += 1
+      self.converted_images[file_path] = ImageCache.convert_surface(image)
+
+    return self.converted_images[file_path]
+
+  #----------------------------------------------------------------------------
+
+  ## Should be called when the display mode changes, the images will be
+  #  converted to the new format again.
+
+  def display_changed(self):
+    self.converted_images = {}
+
+#==============================================================================
+
+## Runs asset loading tasks (decoding of images, sounds etc.) in a pool of
+#  background threads and keeps track of their progress, so that a loading
+#  screen can be shown meanwhile.
+
+class AssetLoader(object):
+  THREADS = 4                     ##< number of the loading threads
+
+  #----------------------------------------------------------------------------
+
+  def __init__(self):
+    self.pool = None              ##< thread pool, created with the first task
+    self.tasks = []               ##< tasks submitted since the last wait(), as multiprocessing AsyncResults
+
+  #----------------------------------------------------------------------------
+
+  ## Makes given function be called with given arguments in a background
+  #  thread. Returns the task whose get() method returns the function's
+  #  return value.
+
+  def submit(self, function, arguments = ()):
+    if self.pool == None:
+      self.pool = multiprocessing.pool.ThreadPool(AssetLoader.THREADS)
+    
+    task = self.pool.apply_async(function,arguments)
+    self.tasks.append(task)
+    return task
+
+  #----------------------------------------------------------------------------
+
+  ## Returns the fraction (0.0 to 1.0) of the submitted tasks that have
+  #  finished.
+
+  def get_progress(self):
+    if len(self.tasks) == 0:
+      return 1.0
+    
+    return len([task for task in self.tasks if task.ready()]) / float(len(self.tasks))
+
+  #----------------------------------------------------------------------------
+
+  def is_done(self):
+    for task in self.tasks:
+      if not task.ready():
+        return False
+      
+    return True
+
+  #----------------------------------------------------------------------------
+
+  ## Waits for all the submitted tasks to finish, an exception raised in
+  #  any of them is raised again here.
+
+  def wait(self):
+    for task in self.tasks:
+      task.get()
+      
+    self.tasks = []
+
+#==============================================================================
+
+## Packs many small images into big surfaces with a rect index. The images
+#  can then be replaced by subsurfaces of the atlas, so that all of them are
+#  drawn from a few source surfaces and stored in a few blocks of memory.
+#  Images with transparent pixels go into an atlas with per-pixel alpha,
+#  fully opaque ones into an atlas without it, so that they are blitted as
+#  fast as plainly converted surfaces.
+
+class TextureAtlas(object):
+  MAX_WIDTH = 2048                ##< maximum width of the atlas in pixels
+
+  #----------------------------------------------------------------------------
+
+  def __init__(self):
+    self.images = []              ##< packed images, kept so that their ids stay valid
+    self.rects = {}               ##< id of the original image -> (True if the image is opaque, rect in the atlas)
+    self.surface = None           ##< atlas of the images with transparency
+    self.opaque_surface = None    ##< atlas of the fully opaque images
+
+  #----------------------------------------------------------------------------
+
+  ## Adds an image to be packed into the atlas with the next build() call.
+
+  def add(self, image):
+    if not id(image) in self.rects:
+      self.rects[id(image)] = None
+      self.images.append(image)
+    
+    return image
+
+  #----------------------------------------------------------------------------
+
+  ## Checks whether given image has no transparent (or semi-transparent) pixels.
+
+  @staticmethod
+  def is_opaque(image):
+    if not image.get_flags() & pygame.SRCALPHA:
+      return True
+    
+    return pygame.mask.from_surface(image,254).count() == image.get_width() * image.get_height()
+
+  #----------------------------------------------------------------------------
+
+  ## Places given images into rows ordered by their height, stores their rects
+  #  and returns the size of the surface they need.
+
+  def __pack(self, images, opaque):
+    x = y = row_height = width = 0
+    
+    for image in sorted(images,key = lambda image: -1 * image.get_height()):
+      if x + image.get_width() > TextureAtlas.MAX_WIDTH:  # start a new row
+        x = 0
+        y += row_height
+        row_height = 0
+      
+      self.rects[id(image)] = (opaque,pygame.Rect((x,y),image.get_size()))
+      x += image.get_width()
+      row_height = max(row_height,image.get_height())
+      width = max(width,x)
+      
+    return (max(width,1),max(y + row_height,1))
+
+  #----------------------------------------------------------------------------
+
+  ## Packs all the added images into the atlas surfaces.
+
+  def build(self):
+    opaque_images = []
+    transparent_images = []
+    
+    for image in self.images:
+      (opaque_images if TextureAtlas.is_opaque(image) else transparent_images).append(image)
+    
+    self.opaque_surface = ImageCache.convert_surface(pygame.Surface(self.__pack(opaque_images,True)))
+    self.surface = ImageCache.convert_surface(pygame.Surface(self.__pack(transparent_images,False),flags=pygame.SRCALPHA))
+    self.surface.fill((0,0,0,0))
+    
+    for image in opaque_images:
+      self.opaque_surface.blit(image,self.rects[id(image)][1])
+    
+    for image in transparent_images:
+      # max blending with the transparent atlas copies the pixels including alpha exactly
+      self.surface.blit(image.convert_alpha(),self.rects[id(image)][1],special_flags=pygame.BLEND_RGBA_MAX)
+      
+    debug_log("texture atlas built: " + str(len(transparent_images)) + " images, size " + str(self.surface.get_size()) + ", " + str(len(opaque_images)) + " opaque images, size " + str(self.opaque_surface.get_size()))
+
+  #----------------------------------------------------------------------------
+
+  ## Returns the subsurface of the atlas holding given (originally added) image,
+  #  or the image itself if it's not in the atlas.
+
+  def get_image(self, image):
+    if not id(image) in self.rects:
+      return image
+    
+    opaque, rect = self.rects[id(image)]
+    
+    return (self.opaque_surface if opaque else self.surface).subsurface(rect)
+
+#==============================================================================
+
+class Animation(object):
+
+  #----------------------------------------------------------------------------
+
+  def __init__(self, filename_prefix, start_number, end_number, filename_postfix, framerate = 10, image_cache = None):
+    self.framerate = framerate
+    self.frame_time = 1000 / self.framerate
+    
+    self.frame_images = []
+    
+    for i in range(start_number,end_number + 1):
+      filename = filename_prefix + str(i) + filename_postfix
+      self.frame_images.append(image_cache.load(filename) if image_cache != None else pygame.image.load(filename))
+      
+    self.playing_instances = []   ##< A set of playing animations, it is a list of tuples in
+                                  #  a format: (pixel_coordinates, started_playing).     
+
+  #----------------------------------------------------------------------------
+
+  def play(self, coordinates):
+    # convert center coordinates to top left coordinates:
+    
+    top_left = (coordinates[0] - self.frame_images[0].get_size()[0] / 2,coordinates[1] - self.frame_images[0].get_size()[1] / 2)
+    self.playing_instances.append((top_left,pygame.time.get_ticks()))
+
+  #----------------------------------------------------------------------------
+    
+  ## Returns a list of (image, position) pairs to draw the current frames of
+  #  all playing instances of the animation (e.g. with Surface.blits), finished
+  #  instances are removed.
+    
+  def get_draw_list(self):
+    i = 0
+    result = []
+    
+    time_now = pygame.time.get_ticks()
+    
+    while True:
+      if i >= len(self.playing_instances):
+        break
+      
+      playing_instance = self.playing_instances[i]
+      
+      frame = int((time_now - playing_instance[1]) / self.frame_time)
+      
+      if frame >= len(self.frame_images):
+        self.playing_instances.remove(playing_instance)
+        continue
+        
+      result.append((self.frame_images[frame],playing_instance[0]))
+      
+      i += 1
+      
+    return result
+
+  #----------------------------------------------------------------------------
+    
+  def draw(self, surface):
+    surface.blits(self.get_draw_list(),doreturn = False)
 
 #==============================================================================
 
@@ -3009,7 +3726,7 @@ class ResultMenu(Menu):
       if player.get_wins() > win_maximum:
         winner_team_numbers = [player.get_team_number()]
         win_maximum = player.get_wins()        
-      elif player.get_wins() == win_maximum:
+      elif player.get_wins() == win_maximum and not player.get_team_number() in winner_team_numbers:
         winner_team_numbers.append(player.get_team_number())
     
     separator = "__________________________________________________"
@@ -3027,7 +3744,7 @@ class ResultMenu(Menu):
         else:
           announcement_text += ", "
           
-        announcement_text += Renderer.colored_color_name(winner_team_numbers[winner_number])
+        announcement_text += Renderer.colored_color_name(winner_number)
     
       announcement_text += "!"
     
@@ -3497,12 +4214,29 @@ class Renderer(object):
   SCROLLBAR_HEIGHT = 300
   
   MENU_DESCRIPTION_Y_OFFSET = -80
+  
+  JUMP_SPRITE_SCALE_STEPS = 25     ##< jumping player's scale is rounded to this many steps, so that the scaled sprites can be cached
+  JUMP_SPRITE_CACHE_SIZE = 64      ##< maximum number of cached scaled jump sprites
+  
+  EARTHQUAKE_SHAKE = 8             ##< maximum offset of the screen (in pixels) when shaking during earthquake
+  
+  TEXT_CACHE_SIZE = 256            ##< maximum number of cached rendered texts
+  
+  MAP_SCALE_STEPS = 10             ##< in map scaling mode the map scale is rounded down to 1 / MAP_SCALE_STEPS
+  MAP_SCALE_RESERVED_HEIGHT = 150  ##< screen height left for the info boards when choosing the map scale
 
   #----------------------------------------------------------------------------
 
-  def __init__(self):
+  def __init__(self, asset_loader = None):
+    self.map_scaling = False           ##< if True, the map is scaled to fill the screen, see set_map_scaling
+    self.unscaled_images = None        ##< images drawn on the map in their original size, in format of __get_map_images
+    self.scaled_images = {}            ##< the same images pre-scaled for the map scales used so far, scale : images
+    
     self.update_screen_info()
 
+    self.image_cache = ImageCache()
+    self.texture_atlas = None          ##< atlas holding the images drawn in game, built in convert_images
+    self.jump_sprite_cache = collections.OrderedDict()   ##< scaled jump sprites, (color index, scale step) : image, ordered from the least recently used
     self.environment_images = {}
     
     self.preview_map_name = ""
@@ -3510,9 +4244,18 @@ class Renderer(object):
 
     self.font_small = pygame.font.Font(os.path.join(Game.RESOURCE_PATH,"Roboto-Medium.ttf"),Renderer.FONT_SMALL_SIZE)
     self.font_normal = pygame.font.Font(os.path.join(Game.RESOURCE_PATH,"Roboto-Medium.ttf"),Renderer.FONT_NORMAL_SIZE)
+    self.text_run_cache = collections.OrderedDict()      ##< outlined single-color pieces of text, (font, text, color, outline color) : image, ordered from the least recently used
+    self.text_cache = collections.OrderedDict()          ##< rendered texts, (font, text, color, outline color, center) : image, ordered from the least recently used
 
     self.previous_mouse_coordinates = (-1,-1)
 
+    self.dirty_rects_mode = False         ##< if True, only the changed parts of the map screen are updated on the display
+    self.dirty_rects = None               ##< rects changed by the last render_map call, None = whole screen
+    self.previous_frame_rects = []        ##< rects of the dynamic things drawn in the previous frame
+    self.tile_render_states = [None for i in range(GameMap.MAP_WIDTH * GameMap.MAP_HEIGHT)]  ##< (what was drawn, rect) for each tile in the previous frame
+    self.full_redraw_needed = True
+    self.earthquake_was_active = False
+
     pygame.mouse.set_visible(False)    # hide mouse cursor
 
     environment_names = ["env1","env2","env3","env4","env5","env6","env7"]
@@ -3522,134 +4265,56 @@ class Renderer(object):
       filename_block = os.path.join(Game.RESOURCE_PATH,"tile_" + environment_name + "_block.png")
       filename_wall = os.path.join(Game.RESOURCE_PATH,"tile_" + environment_name + "_wall.png")
 
-      self.environment_images[environment_name] = (pygame.image.load(filename_floor),pygame.image.load(filename_block),pygame.image.load(filename_wall))
+      self.environment_images[environment_name] = (self.image_cache.load(filename_floor),self.image_cache.load(filename_block),self.image_cache.load(filename_wall))
 
     self.prerendered_map = None     # keeps a reference to a map for which some parts have been prerendered
-    self.prerendered_map_background = pygame.Surface((GameMap.MAP_WIDTH * Renderer.MAP_TILE_WIDTH + 2 * Renderer.MAP_BORDER_WIDTH,GameMap.MAP_HEIGHT * Renderer.MAP_TILE_HEIGHT + 2 * Renderer.MAP_BORDER_WIDTH))
+    self.block_layer_rows = [None for i in range(GameMap.MAP_HEIGHT)]  ##< cached images of block and wall rows in format (version, image)
 
-    self.player_images = []         ##< player images in format [color index]["sprite name"] and [color index]["sprite name"][frame]
+    self.asset_loader = asset_loader if asset_loader != None else AssetLoader()
+    self.game_images_loaded = False    ##< whether the images needed only in game have been loaded, see load_game_images
+    self.player_image_tasks = None     ##< background tasks coloring the player images, see prepare_game_images
 
-    for i in range(10):
-      self.player_images.append({})
-      
-      for helper_string in ["up","right","down","left"]:
-        self.player_images[-1][helper_string] =  self.color_surface(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + ".png")),i)
-        
-        string_index = "walk " + helper_string
-      
-        self.player_images[-1][string_index] = []
-        self.player_images[-1][string_index].append(self.color_surface(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + "_walk1.png")),i))
-        
-        if helper_string == "up" or helper_string == "down":
-          self.player_images[-1][string_index].append(self.color_surface(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + "_walk2.png")),i))
-        else:
-          self.player_images[-1][string_index].append(self.player_images[-1][helper_string])
-        
-        self.player_images[-1][string_index].append(self.color_surface(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + "_walk3.png")),i))
-        self.player_images[-1][string_index].append(self.player_images[-1][string_index][0])
-        
-        string_index = "box " + helper_string
-        self.player_images[-1][string_index] = self.color_surface(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + "_box.png")),i)
-     
+    self.player_images = []         ##< player images in format [color index]["sprite name"] and [color index]["sprite name"][frame]
     self.bomb_images = []
-    self.bomb_images.append(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"bomb1.png")))
-    self.bomb_images.append(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"bomb2.png")))
-    self.bomb_images.append(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"bomb3.png")))
-    self.bomb_images.append(self.bomb_images[0])
-     
-    # load flame images
-    
     self.flame_images = []
-    
-    for i in [1,2]:
-      helper_string = "flame" + str(i)
-      
-      self.flame_images.append({})
-      self.flame_images[-1]["all"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,helper_string + ".png"))
-      self.flame_images[-1]["horizontal"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_horizontal.png"))
-      self.flame_images[-1]["vertical"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_vertical.png"))
-      self.flame_images[-1]["left"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_left.png"))
-      self.flame_images[-1]["right"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_right.png"))
-      self.flame_images[-1]["up"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_up.png"))
-      self.flame_images[-1]["down"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_down.png"))
-      
-    # load item images
-    
     self.item_images = {}
-    
-    self.item_images[GameMap.ITEM_BOMB] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_bomb.png"))
-    self.item_images[GameMap.ITEM_FLAME] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_flame.png"))
-    self.item_images[GameMap.ITEM_SUPERFLAME] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_superflame.png"))
-    self.item_images[GameMap.ITEM_SPEEDUP] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_speedup.png"))
-    self.item_images[GameMap.ITEM_DISEASE] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_disease.png"))
-    self.item_images[GameMap.ITEM_RANDOM] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_random.png"))
-    self.item_images[GameMap.ITEM_SPRING] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_spring.png"))
-    self.item_images[GameMap.ITEM_SHOE] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_shoe.png"))
-    self.item_images[GameMap.ITEM_MULTIBOMB] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_multibomb.png"))
-    self.item_images[GameMap.ITEM_RANDOM] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_random.png"))
-    self.item_images[GameMap.ITEM_BOXING_GLOVE] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_boxing_glove.png"))
-    self.item_images[GameMap.ITEM_DETONATOR] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_detonator.png"))
-    self.item_images[GameMap.ITEM_THROWING_GLOVE] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"item_throwing_glove.png"))
+    self.other_images = {}
+    self.animations = {}
       
     # load/make gui images
     
     self.gui_images = {}
-    self.gui_images["info board"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_info_board.png"))   
-    self.gui_images["arrow up"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_arrow_up.png"))   
-    self.gui_images["arrow down"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_arrow_down.png"))   
-    self.gui_images["seeker"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_seeker.png"))
-    self.gui_images["cursor"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_cursor.png"))   
+    self.gui_images["arrow up"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_arrow_up.png"))   
+    self.gui_images["arrow down"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_arrow_down.png"))   
+    self.gui_images["seeker"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_seeker.png"))
+    self.gui_images["cursor"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_cursor.png"))   
     self.gui_images["prompt"] = self.render_text(self.font_normal,"You sure?",(255,255,255))
     self.gui_images["version"] = self.render_text(self.font_small,"v " + Game.VERSION_STR,(0,100,0))
+    self.gui_images["loading"] = self.render_text(self.font_normal,"loading",(255,255,255))
     
     self.player_info_board_images = [None for i in range(10)]  # up to date infoboard image for each player
 
-    self.gui_images["out"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_out.png"))   
-     
-    self.gui_images["countdown"] = {}
-    
-    self.gui_images["countdown"][1] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_countdown_1.png"))
-    self.gui_images["countdown"][2] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_countdown_2.png"))
-    self.gui_images["countdown"][3] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_countdown_3.png"))
-    
     self.menu_background_image = None  ##< only loaded when in menu
     self.menu_item_images = None       ##< images of menu items, only loaded when in menu
- 
-    # load other images
-    
-    self.other_images = {}
-    
-    self.other_images["shadow"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_shadow.png"))
-    self.other_images["spring"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_spring.png"))
-    self.other_images["antena"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_antena.png"))
-     
-    self.other_images["disease"] = []
-    self.other_images["disease"].append(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_disease1.png")))
-    self.other_images["disease"].append(pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_disease2.png")))    
+    self.menu_static_image = None      ##< cached image of the parts of the menu that don't animate, only allocated when in menu
+    self.menu_state_key = None         ##< state of the menu the static image was composed for, see __get_menu_state_key
+    self.menu_layout = []              ##< positions of the visible menu items in format (item coordinates, image, center x, y)
+    self.menu_animated_rects = []      ##< rects of the animated parts of the menu drawn in the previous frame
           
-    # load icon images
+    # load icon images (also needed by the map preview in menu)
     
     self.icon_images = {}
-    self.icon_images[GameMap.ITEM_BOMB] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_bomb.png"))
-    self.icon_images[GameMap.ITEM_FLAME] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_flame.png"))
-    self.icon_images[GameMap.ITEM_SPEEDUP] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_speedup.png"))
-    self.icon_images[GameMap.ITEM_SHOE] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_kicking_shoe.png"))
-    self.icon_images[GameMap.ITEM_BOXING_GLOVE] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_boxing_glove.png"))
-    self.icon_images[GameMap.ITEM_THROWING_GLOVE] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_throwing_glove.png"))
-    self.icon_images[GameMap.ITEM_SPRING] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_spring.png"))
-    self.icon_images[GameMap.ITEM_MULTIBOMB] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_multibomb.png"))
-    self.icon_images[GameMap.ITEM_DISEASE] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_disease.png"))
-    self.icon_images[GameMap.ITEM_DETONATOR] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_detonator.png"))
-    self.icon_images["etc"] = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"icon_etc.png"))
-    
-    # load animations
-    
-    self.animations = {}
-    self.animations[Renderer.ANIMATION_EVENT_EXPLOSION] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_explosion"),1,10,".png",7)
-    self.animations[Renderer.ANIMATION_EVENT_RIP] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_rip"),1,1,".png",0.3)
-    self.animations[Renderer.ANIMATION_EVENT_SKELETION] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_skeleton"),1,10,".png",7)
-    self.animations[Renderer.ANIMATION_EVENT_DISEASE_CLOUD] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_disease"),1,6,".png",5)
-    self.animations[Renderer.ANIMATION_EVENT_DIE] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_die"),1,7,".png",7)
+    self.icon_images[GameMap.ITEM_BOMB] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_bomb.png"))
+    self.icon_images[GameMap.ITEM_FLAME] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_flame.png"))
+    self.icon_images[GameMap.ITEM_SPEEDUP] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_speedup.png"))
+    self.icon_images[GameMap.ITEM_SHOE] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_kicking_shoe.png"))
+    self.icon_images[GameMap.ITEM_BOXING_GLOVE] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_boxing_glove.png"))
+    self.icon_images[GameMap.ITEM_THROWING_GLOVE] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_throwing_glove.png"))
+    self.icon_images[GameMap.ITEM_SPRING] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_spring.png"))
+    self.icon_images[GameMap.ITEM_MULTIBOMB] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_multibomb.png"))
+    self.icon_images[GameMap.ITEM_DISEASE] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_disease.png"))
+    self.icon_images[GameMap.ITEM_DETONATOR] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_detonator.png"))
+    self.icon_images["etc"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"icon_etc.png"))
 
     self.party_circles = []     ##< holds info about party cheat circles, list of tuples in format (coords,radius,color,phase,speed)
     self.party_circles.append(((-180,110),40,(255,100,50),0.0,1.0))
@@ -3676,100 +4341,538 @@ class Renderer(object):
     self.party_bombs.append([405,530,1,-1])
     self.party_bombs.append([250,130,-1,-1])
 
-  #----------------------------------------------------------------------------
-
-  def update_screen_info(self):
-    self.screen_resolution = Renderer.get_screen_size()
-    self.screen_center = (self.screen_resolution[0] / 2,self.screen_resolution[1] / 2)
-    self.map_render_location = Renderer.get_map_render_position()
+    self.convert_images()
 
   #----------------------------------------------------------------------------
-  
-  ## Converts (r,g,b) tuple to html #rrggbb notation.
 
-  @staticmethod
-  def rgb_to_html_notation(rgb_color):
-    return "#" + hex(rgb_color[0])[2:].zfill(2) + hex(rgb_color[1])[2:].zfill(2) + hex(rgb_color[2])[2:].zfill(2)
-
-  #----------------------------------------------------------------------------
-     
-  @staticmethod
-  def colored_text(color_index, text, end_with_white=True):
-    return "^" + Renderer.rgb_to_html_notation(Renderer.lighten_color(Renderer.COLOR_RGB_VALUES[color_index],75)) + text + "^#FFFFFF"
+  ## Makes the images of players of given color, this is run in a background
+  #  thread (see prepare_game_images), so the images are not converted here.
 
-  #----------------------------------------------------------------------------
+  def __make_player_images(self, color_index):
+    player_images = {}
     
-  @staticmethod
-  def colored_color_name(color_index, end_with_white=True):
-    return Renderer.colored_text(color_index,Game.COLOR_NAMES[color_index])
-
-  #----------------------------------------------------------------------------
-  
-  ## Returns colored image from another image (replaces red color with given color). This method is slow. Color is (r,g,b) tuple of 0 - 1 floats.
-
-  def color_surface(self, surface, color_number):
-    result = surface.copy()
     
-    # change all red pixels to specified color
-    for j in range(result.get_size()[1]):
-      for i in range(result.get_size()[0]):
-        pixel_color = result.get_at((i,j))
+    for helper_string in ["up","right","down","left"]:
+      player_images[helper_string] =  self.load_colored_image(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + ".png"),color_index)
+      
+      string_index = "walk " + helper_string
+    
+      player_images[string_index] = []
+      player_images[string_index].append(self.load_colored_image(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + "_walk1.png"),color_index))
+      
+      if helper_string == "up" or helper_string == "down":
+        player_images[string_index].append(self.load_colored_image(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + "_walk2.png"),color_index))
+      else:
+        player_images[string_index].append(player_images[helper_string])
+      
+      player_images[string_index].append(self.load_colored_image(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + "_walk3.png"),color_index))
+      player_images[string_index].append(player_images[string_index][0])
+      
+      string_index = "box " + helper_string
+      player_images[string_index] = self.load_colored_image(os.path.join(Game.RESOURCE_PATH,"player_" + helper_string + "_box.png"),color_index)
         
-        if pixel_color.r == 255 and pixel_color.g == 0 and pixel_color.b == 0:
-          pixel_color.r = Renderer.COLOR_RGB_VALUES[color_number][0]
-          pixel_color.g = Renderer.COLOR_RGB_VALUES[color_number][1]
-          pixel_color.b = Renderer.COLOR_RGB_VALUES[color_number][2]
-          result.set_at((i,j),pixel_color)
-
-    return result
+    return player_images
 
   #----------------------------------------------------------------------------
 
-  def tile_position_to_pixel_position(self, tile_position,center=(0,0)):
-    return (int(float(tile_position[0]) * Renderer.MAP_TILE_WIDTH) - center[0],int(float(tile_position[1]) * Renderer.MAP_TILE_HEIGHT) - center[1])
-
-  #----------------------------------------------------------------------------
+  ## Starts loading the images needed only in game in background threads (the
+  #  image decoding and coloring of the player images), so that they're ready
+  #  by the time the game starts. The loading is finished by load_game_images.
 
-  @staticmethod
-  def get_screen_size():
-    display = pygame.display.get_surface()
+  def prepare_game_images(self):
+    if self.game_images_loaded or self.player_image_tasks != None:
+      return
     
-    return display.get_size() if display != None else (0,0)
-
-  #----------------------------------------------------------------------------
-
-  @staticmethod  
-  def get_map_render_position(): 
-    screen_size = Renderer.get_screen_size()
-    return ((screen_size[0] - Renderer.MAP_BORDER_WIDTH * 2 - Renderer.MAP_TILE_WIDTH * GameMap.MAP_WIDTH) / 2,(screen_size[1] - Renderer.MAP_BORDER_WIDTH * 2 - Renderer.MAP_TILE_HEIGHT * GameMap.MAP_HEIGHT - 50) / 2)  
-
-  #----------------------------------------------------------------------------
+    debug_log("loading game images in background")
     
-  @staticmethod
-  def map_position_to_pixel_position(map_position, offset = (0,0)):
-    map_render_location = Renderer.get_map_render_position()
-    return (map_render_location[0] + int(map_position[0] * Renderer.MAP_TILE_WIDTH) + Renderer.MAP_BORDER_WIDTH + offset[0],map_render_location[1] + int(map_position[1] * Renderer.MAP_TILE_HEIGHT) + Renderer.MAP_BORDER_WIDTH + offset[1])
+    for file_name in sorted(os.listdir(Game.RESOURCE_PATH)):
+      if file_name.endswith(".png"):
+        self.asset_loader.submit(self.image_cache.decode,(os.path.join(Game.RESOURCE_PATH,file_name),))
     
-  def set_resolution(self, new_resolution):
-    self.screen_resolution = new_resolution
-
-  #----------------------------------------------------------------------------
-
-  @staticmethod
-  def darken_color(color, by_how_may):
-    r = max(color[0] - by_how_may,0)
-    g = max(color[1] - by_how_may,0)
-    b = max(color[2] - by_how_may,0)
-    return (r,g,b)
+    self.player_image_tasks = [self.asset_loader.submit(self.__make_player_images,(i,)) for i in range(10)]
 
   #----------------------------------------------------------------------------
 
-  @staticmethod
-  def lighten_color(color, by_how_may):
-    r = min(color[0] + by_how_may,255)
-    g = min(color[1] + by_how_may,255)
-    b = min(color[2] + by_how_may,255)
-    return (r,g,b)
+  ## Loads the images needed only in game (players, bombs, flames, items,
+  #  animations etc.), waiting for the background loading started by
+  #  prepare_game_images if needed. Does nothing when they're already loaded.
+
+  def load_game_images(self):
+    if self.game_images_loaded:
+      return
+    
+    self.prepare_game_images()
+    self.asset_loader.wait()
+    
+    debug_log("loading game images")
+    
+    if self.unscaled_images != None:
+      self.__set_map_images(self.unscaled_images)  # the images are loaded in the original size, scaled by convert_images
+    
+    self.player_images = [task.get() for task in self.player_image_tasks]
+    self.player_image_tasks = None
+     
+    self.bomb_images = []
+    self.bomb_images.append(self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"bomb1.png")))
+    self.bomb_images.append(self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"bomb2.png")))
+    self.bomb_images.append(self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"bomb3.png")))
+    self.bomb_images.append(self.bomb_images[0])
+     
+    # load flame images
+    
+    self.flame_images = []
+    
+    for i in [1,2]:
+      helper_string = "flame" + str(i)
+      
+      self.flame_images.append({})
+      self.flame_images[-1]["all"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,helper_string + ".png"))
+      self.flame_images[-1]["horizontal"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_horizontal.png"))
+      self.flame_images[-1]["vertical"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_vertical.png"))
+      self.flame_images[-1]["left"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_left.png"))
+      self.flame_images[-1]["right"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_right.png"))
+      self.flame_images[-1]["up"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_up.png"))
+      self.flame_images[-1]["down"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,helper_string + "_down.png"))
+      
+    # load item images
+    
+    self.item_images = {}
+    
+    self.item_images[GameMap.ITEM_BOMB] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_bomb.png"))
+    self.item_images[GameMap.ITEM_FLAME] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_flame.png"))
+    self.item_images[GameMap.ITEM_SUPERFLAME] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_superflame.png"))
+    self.item_images[GameMap.ITEM_SPEEDUP] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_speedup.png"))
+    self.item_images[GameMap.ITEM_DISEASE] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_disease.png"))
+    self.item_images[GameMap.ITEM_RANDOM] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_random.png"))
+    self.item_images[GameMap.ITEM_SPRING] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_spring.png"))
+    self.item_images[GameMap.ITEM_SHOE] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_shoe.png"))
+    self.item_images[GameMap.ITEM_MULTIBOMB] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_multibomb.png"))
+    self.item_images[GameMap.ITEM_RANDOM] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_random.png"))
+    self.item_images[GameMap.ITEM_BOXING_GLOVE] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_boxing_glove.png"))
+    self.item_images[GameMap.ITEM_DETONATOR] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_detonator.png"))
+    self.item_images[GameMap.ITEM_THROWING_GLOVE] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"item_throwing_glove.png"))
+      
+    # load gui images
+    
+    self.gui_images["info board"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_info_board.png"))   
+    self.gui_images["out"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_out.png"))   
+     
+    self.gui_images["countdown"] = {}
+    
+    self.gui_images["countdown"][1] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_countdown_1.png"))
+    self.gui_images["countdown"][2] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_countdown_2.png"))
+    self.gui_images["countdown"][3] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_countdown_3.png"))
+    
+    # load other images
+    
+    self.other_images["shadow"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_shadow.png"))
+    self.other_images["spring"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_spring.png"))
+    self.other_images["antena"] = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_antena.png"))
+     
+    self.other_images["disease"] = []
+    self.other_images["disease"].append(self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_disease1.png")))
+    self.other_images["disease"].append(self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_disease2.png")))    
+          
+    # load animations
+    
+    self.animations = {}
+    self.animations[Renderer.ANIMATION_EVENT_EXPLOSION] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_explosion"),1,10,".png",7,self.image_cache)
+    self.animations[Renderer.ANIMATION_EVENT_RIP] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_rip"),1,1,".png",0.3,self.image_cache)
+    self.animations[Renderer.ANIMATION_EVENT_SKELETION] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_skeleton"),1,10,".png",7,self.image_cache)
+    self.animations[Renderer.ANIMATION_EVENT_DISEASE_CLOUD] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_disease"),1,6,".png",5,self.image_cache)
+    self.animations[Renderer.ANIMATION_EVENT_DIE] = Animation(os.path.join(Game.RESOURCE_PATH,"animation_die"),1,7,".png",7,self.image_cache)
+    
+    self.game_images_loaded = True
+    self.unscaled_images = self.__get_map_images()
+    self.convert_images()
+
+  #----------------------------------------------------------------------------
+
+  ## Renders the loading screen with a progress bar showing given progress
+  #  (0.0 to 1.0) and returns it.
+
+  def render_loading_screen(self, progress):
+    result = self.frame_surface
+    result.fill((0,0,0))
+    
+    self.full_redraw_needed = True
+    self.menu_state_key = None
+    self.dirty_rects = None
+    
+    bar_size = (200,10)
+    
+    text_image = self.gui_images["loading"]
+    result.blit(text_image,(self.screen_center[0] - text_image.get_size()[0] / 2,self.screen_center[1] - text_image.get_size()[1] - bar_size[1]))
+    
+    bar_rect = pygame.Rect(self.screen_center[0] - bar_size[0] / 2,self.screen_center[1] + bar_size[1],bar_size[0],bar_size[1])
+    pygame.draw.rect(result,(255,255,255),bar_rect,1)
+    pygame.draw.rect(result,(255,255,255),pygame.Rect(bar_rect.x,bar_rect.y,int(bar_rect.width * min(1.0,progress)),bar_rect.height))
+    
+    return result
+
+  #----------------------------------------------------------------------------
+
+  def update_screen_info(self):
+    self.screen_resolution = Renderer.get_screen_size()
+    self.screen_center = (self.screen_resolution[0] / 2,self.screen_resolution[1] / 2)
+    self.update_frame_surface()
+    self.__update_map_scale()
+    self.full_redraw_needed = True
+
+  #----------------------------------------------------------------------------
+
+  ## Turns the map scaling mode on/off. In this mode the map is drawn with a
+  #  tile size chosen for the screen resolution (see
+  #  get_map_scale_for_resolution) instead of the fixed MAP_TILE_WIDTH x
+  #  MAP_TILE_HEIGHT. The images drawn on the map are scaled once for each
+  #  scale and cached, never per frame.
+
+  def set_map_scaling(self, map_scaling):
+    self.map_scaling = map_scaling
+    self.__update_map_scale()
+
+  #----------------------------------------------------------------------------
+
+  ## Returns the images drawn on the map (the ones that are scaled in map
+  #  scaling mode) as a tuple.
+
+  def __get_map_images(self):
+    animation_frames = {animation_index: self.animations[animation_index].frame_images for animation_index in self.animations}
+    return (self.environment_images,self.player_images,self.bomb_images,self.flame_images,self.item_images,self.other_images,animation_frames)
+
+  #----------------------------------------------------------------------------
+
+  ## Sets the images drawn on the map, see __get_map_images.
+
+  def __set_map_images(self, images):
+    self.environment_images, self.player_images, self.bomb_images, self.flame_images, self.item_images, self.other_images, animation_frames = images
+    
+    for animation_index in animation_frames:
+      self.animations[animation_index].frame_images = animation_frames[animation_index]
+
+  #----------------------------------------------------------------------------
+
+  ## Sets the map scale for the current resolution and mode, the sizes derived
+  #  from it and the images drawn on the map pre-scaled for it.
+
+  def __update_map_scale(self):
+    if self.map_scaling and self.screen_resolution[0] > 0:
+      self.map_scale = Renderer.get_map_scale_for_resolution(self.screen_resolution)
+    else:
+      self.map_scale = 1.0
+    
+    scale = lambda length: Renderer.scale_length(length,self.map_scale)
+    
+    self.tile_width = scale(Renderer.MAP_TILE_WIDTH)
+    self.tile_height = scale(Renderer.MAP_TILE_HEIGHT)
+    self.map_border_width = scale(Renderer.MAP_BORDER_WIDTH)
+    self.player_sprite_center = (scale(Renderer.PLAYER_SPRITE_CENTER[0]),scale(Renderer.PLAYER_SPRITE_CENTER[1]))
+    self.bomb_sprite_center = (scale(Renderer.BOMB_SPRITE_CENTER[0]),scale(Renderer.BOMB_SPRITE_CENTER[1]))
+    self.shadow_sprite_center = (scale(Renderer.SHADOW_SPRITE_CENTER[0]),scale(Renderer.SHADOW_SPRITE_CENTER[1]))
+    self.map_render_location = Renderer.get_map_render_position(self.map_scale)
+    
+    if self.unscaled_images != None:
+      if self.map_scale == 1.0:
+        self.__set_map_images(self.unscaled_images)
+      else:
+        if not self.map_scale in self.scaled_images:
+          debug_log("scaling map images to " + str(self.map_scale))
+          self.scaled_images[self.map_scale] = Renderer.map_images(self.unscaled_images,lambda image: Renderer.scale_image(image,self.map_scale),{})
+        
+        self.__set_map_images(self.scaled_images[self.map_scale])
+    
+    self.prerendered_map_background = ImageCache.convert_surface(pygame.Surface((GameMap.MAP_WIDTH * self.tile_width + 2 * self.map_border_width,GameMap.MAP_HEIGHT * self.tile_height + 2 * self.map_border_width)))
+    self.prerendered_map = None                   # the map has to be prerendered again
+    self.jump_sprite_cache = collections.OrderedDict()
+    self.tile_render_states = [None for i in range(GameMap.MAP_WIDTH * GameMap.MAP_HEIGHT)]
+    self.full_redraw_needed = True
+
+  #----------------------------------------------------------------------------
+
+  ## Sets the surface into which the frames are rendered: the display surface,
+  #  so that no full screen surface has to be allocated and copied each frame,
+  #  or if there is no display, a back buffer of the screen resolution.
+
+  def update_frame_surface(self):
+    display = pygame.display.get_surface()
+    
+    if display != None:
+      self.frame_surface = display
+    else:
+      self.frame_surface = pygame.Surface(self.screen_resolution)
+      
+    self.menu_state_key = None                    # the menu has to be drawn again into the new surface
+
+  #----------------------------------------------------------------------------
+
+  ## Converts all images the renderer holds to the current display pixel
+  #  format, should be called after the display mode has been set or changed.
+
+  def convert_images(self):
+    if pygame.display.get_surface() == None:
+      return
+    
+    debug_log("converting images to the display format")
+    
+    if self.unscaled_images != None:
+      self.__set_map_images(self.unscaled_images)    # the scaled images will be made from the converted ones again
+    
+    self.image_cache.display_changed()
+    converted = {}            # id of the original surface -> converted surface, so that shared images stay shared
+    convert = lambda images: Renderer.map_images(images,ImageCache.convert_surface,converted)
+    
+    self.environment_images = convert(self.environment_images)
+    self.player_images = convert(self.player_images)
+    self.bomb_images = convert(self.bomb_images)
+    self.flame_images = convert(self.flame_images)
+    self.item_images = convert(self.item_images)
+    self.gui_images = convert(self.gui_images)
+    self.player_info_board_images = convert(self.player_info_board_images)
+    self.other_images = convert(self.other_images)
+    self.icon_images = convert(self.icon_images)
+    self.menu_background_image = convert(self.menu_background_image)
+    self.menu_item_images = convert(self.menu_item_images)
+    self.preview_map_image = convert(self.preview_map_image)
+    
+    for animation_index in self.animations:
+      self.animations[animation_index].frame_images = convert(self.animations[animation_index].frame_images)
+    
+    # pack the images drawn in game into a texture atlas:
+    
+    self.texture_atlas = TextureAtlas()
+    Renderer.map_images((self.environment_images,self.player_images,self.bomb_images,self.flame_images,self.item_images,self.other_images,self.icon_images),self.texture_atlas.add,{})
+    self.texture_atlas.build()
+    
+    atlas_images = {}
+    to_atlas = lambda images: Renderer.map_images(images,self.texture_atlas.get_image,atlas_images)
+    
+    self.environment_images = to_atlas(self.environment_images)
+    self.player_images = to_atlas(self.player_images)
+    self.bomb_images = to_atlas(self.bomb_images)
+    self.flame_images = to_atlas(self.flame_images)
+    self.item_images = to_atlas(self.item_images)
+    self.other_images = to_atlas(self.other_images)
+    self.icon_images = to_atlas(self.icon_images)
+    
+    self.unscaled_images = self.__get_map_images()
+    self.scaled_images = {}
+    self.__update_map_scale()
+    
+    self.block_layer_rows = [None for i in range(GameMap.MAP_HEIGHT)]
+    self.menu_state_key = None
+
+  #----------------------------------------------------------------------------
+
+  ## Applies given function to all surfaces in a structure of nested dicts,
+  #  lists and tuples and returns the same structure with the function results.
+  #  Results are remembered in results dict (by surface ids), so that a surface
+  #  that is shared in the structure stays shared.
+
+  @staticmethod
+  def map_images(images, function, results):
+    if isinstance(images,pygame.Surface):
+      if not id(images) in results:
+        results[id(images)] = function(images)
+      
+      return results[id(images)]
+    elif isinstance(images,dict):
+      return {key: Renderer.map_images(images[key],function,results) for key in images}
+    elif isinstance(images,list):
+      return [Renderer.map_images(item,function,results) for item in images]
+    elif isinstance(images,tuple):
+      return tuple([Renderer.map_images(item,function,results) for item in images])
+      
+    return images
+
+  #----------------------------------------------------------------------------
+
+  ## Turns the dirty rects mode on/off. In this mode render_map remembers which
+  #  parts of the screen changed since the previous frame (see get_dirty_rects),
+  #  so that only these have to be updated on the display.
+
+  def set_dirty_rects_mode(self, dirty_rects_mode):
+    self.dirty_rects_mode = dirty_rects_mode
+    self.full_redraw_needed = True
+
+  #----------------------------------------------------------------------------
+
+  ## Returns a list of screen rects that changed with the last call of
+  #  render_map, or None if the whole screen has to be updated.
+
+  def get_dirty_rects(self):
+    return self.dirty_rects
+
+  #----------------------------------------------------------------------------
+  
+  ## Converts (r,g,b) tuple to html #rrggbb notation.
+
+  @staticmethod
+  def rgb_to_html_notation(rgb_color):
+    return "#" + hex(rgb_color[0])[2:].zfill(2) + hex(rgb_color[1])[2:].zfill(2) + hex(rgb_color[2])[2:].zfill(2)
+
+  #----------------------------------------------------------------------------
+     
+  @staticmethod
+  def colored_text(color_index, text, end_with_white=True):
+    return "^" + Renderer.rgb_to_html_notation(Renderer.lighten_color(Renderer.COLOR_RGB_VALUES[color_index],75)) + text + "^#FFFFFF"
+
+  #----------------------------------------------------------------------------
+    
+  @staticmethod
+  def colored_color_name(color_index, end_with_white=True):
+    return Renderer.colored_text(color_index,Game.COLOR_NAMES[color_index])
+
+  #----------------------------------------------------------------------------
+  
+  ## Returns colored image from another image (replaces pure red pixels with
+  #  the color given by its number in COLOR_RGB_VALUES). The pixels are
+  #  replaced in one numpy pass, the slow get_at/set_at loop is only a fallback
+  #  for when numpy is missing (or the surface isn't 24 or 32 bit).
+
+  def color_surface(self, surface, color_number):
+    result = surface.copy()
+    
+    if numpy != None and result.get_bitsize() in (24,32):
+      # change all red pixels to specified color, in one pass with numpy
+      pixels = pygame.surfarray.pixels3d(result)       # references the surface pixels, locks the surface
+      red_pixels = (pixels[:,:,0] == 255) & (pixels[:,:,1] == 0) & (pixels[:,:,2] == 0)
+      pixels[red_pixels] = Renderer.COLOR_RGB_VALUES[color_number]
+      del pixels                                       # unlocks the surface
+      return result
+    
+    # change all red pixels to specified color
+    for j in range(result.get_size()[1]):
+      for i in range(result.get_size()[0]):
+        pixel_color = result.get_at((i,j))
+        
+        if pixel_color.r == 255 and pixel_color.g == 0 and pixel_color.b == 0:
+          pixel_color.r = Renderer.COLOR_RGB_VALUES[color_number][0]
+          pixel_color.g = Renderer.COLOR_RGB_VALUES[color_number][1]
+          pixel_color.b = Renderer.COLOR_RGB_VALUES[color_number][2]
+          result.set_at((i,j),pixel_color)
+
+    return result
+
+  #----------------------------------------------------------------------------
+
+  ## Returns the image from given file colored with color_surface. The colored
+  #  images are cached on disk in Game.CACHE_PATH, keyed by the source file's
+  #  modification time and the color, so they're only computed once. Can be
+  #  called from the background loading threads.
+
+  def load_colored_image(self, file_path, color_number):
+    key = repr((os.path.basename(file_path),os.path.getmtime(file_path),Renderer.COLOR_RGB_VALUES[color_number]))
+    cache_file_path = os.path.join(Game.CACHE_PATH,hashlib.md5(key.encode("utf-8")).hexdigest() + ".png")
+    
+    if os.path.isfile(cache_file_path):
+      try:
+        return pygame.image.load(cache_file_path)
+      except pygame.error:
+        debug_log("could not load cached image " + cache_file_path)
+    
+    result = self.color_surface(self.image_cache.decode(file_path),color_number)
+    
+    try:
+      if not os.path.isdir(Game.CACHE_PATH):
+        os.makedirs(Game.CACHE_PATH)
+      
+      temporary_file_path = cache_file_path[:-4] + "_" + str(os.getpid()) + "_tmp.png"
+      pygame.image.save(result,temporary_file_path)
+      os.rename(temporary_file_path,cache_file_path)    # so that other processes never see a half written file
+    except (OSError,IOError,pygame.error):
+      debug_log("could not save cached image " + cache_file_path)
+    
+    return result
+
+  #----------------------------------------------------------------------------
+
+  def tile_position_to_pixel_position(self, tile_position,center=(0,0)):
+    return (int(float(tile_position[0]) * self.tile_width) - center[0],int(float(tile_position[1]) * self.tile_height) - center[1])
+
+  #----------------------------------------------------------------------------
+
+  @staticmethod
+  def get_screen_size():
+    display = pygame.display.get_surface()
+    
+    return display.get_size() if display != None else (0,0)
+
+  #----------------------------------------------------------------------------
+
+  @staticmethod  
+  def get_map_render_position(map_scale = 1.0): 
+    screen_size = Renderer.get_screen_size()
+    border_width = Renderer.scale_length(Renderer.MAP_BORDER_WIDTH,map_scale)
+    tile_width = Renderer.scale_length(Renderer.MAP_TILE_WIDTH,map_scale)
+    tile_height = Renderer.scale_length(Renderer.MAP_TILE_HEIGHT,map_scale)
+    return ((screen_size[0] - border_width * 2 - tile_width * GameMap.MAP_WIDTH) / 2,(screen_size[1] - border_width * 2 - tile_height * GameMap.MAP_HEIGHT - 50) / 2)  
+
+  #----------------------------------------------------------------------------
+
+  ## Returns the map scale used in map scaling mode for given screen
+  #  resolution: the biggest one (rounded down to 1 / MAP_SCALE_STEPS) with
+  #  which the map and the info boards fit on the screen.
+
+  @staticmethod
+  def get_map_scale_for_resolution(resolution):
+    map_width = GameMap.MAP_WIDTH * Renderer.MAP_TILE_WIDTH + 2 * Renderer.MAP_BORDER_WIDTH
+    map_height = GameMap.MAP_HEIGHT * Renderer.MAP_TILE_HEIGHT + 2 * Renderer.MAP_BORDER_WIDTH
+    
+    scale = min(resolution[0] / float(map_width),(resolution[1] - Renderer.MAP_SCALE_RESERVED_HEIGHT) / float(map_height))
+    
+    return max(1,int(scale * Renderer.MAP_SCALE_STEPS)) / float(Renderer.MAP_SCALE_STEPS)
+
+  #----------------------------------------------------------------------------
+
+  @staticmethod
+  def scale_length(length, map_scale):
+    return int(round(length * map_scale))
+
+  #----------------------------------------------------------------------------
+
+  ## Returns given image scaled by given map scale (smoothly if the image's
+  #  format allows it), or the image itself for scale 1.
+
+  @staticmethod
+  def scale_image(image, map_scale):
+    if map_scale == 1.0:
+      return image
+    
+    new_size = (max(1,Renderer.scale_length(image.get_width(),map_scale)),max(1,Renderer.scale_length(image.get_height(),map_scale)))
+    
+    if image.get_bitsize() in (24,32):
+      return pygame.transform.smoothscale(image,new_size)
+    
+    return pygame.transform.scale(image,new_size)
+
+  #----------------------------------------------------------------------------
+    
+  @staticmethod
+  def map_position_to_pixel_position(map_position, offset = (0,0)):
+    map_render_location = Renderer.get_map_render_position()
+    return (map_render_location[0] + int(map_position[0] * Renderer.MAP_TILE_WIDTH) + Renderer.MAP_BORDER_WIDTH + offset[0],map_render_location[1] + int(map_position[1] * Renderer.MAP_TILE_HEIGHT) + Renderer.MAP_BORDER_WIDTH + offset[1])
+    
+  def set_resolution(self, new_resolution):
+    self.screen_resolution = new_resolution
+    self.update_frame_surface()
+
+  #----------------------------------------------------------------------------
+
+  @staticmethod
+  def darken_color(color, by_how_may):
+    r = max(color[0] - by_how_may,0)
+    g = max(color[1] - by_how_may,0)
+    b = max(color[2] - by_how_may,0)
+    return (r,g,b)
+
+  #----------------------------------------------------------------------------
+
+  @staticmethod
+  def lighten_color(color, by_how_may):
+    r = min(color[0] + by_how_may,255)
+    g = min(color[1] + by_how_may,255)
+    b = min(color[2] + by_how_may,255)
+    return (r,g,b)
 
   #----------------------------------------------------------------------------
 
@@ -3824,9 +4927,9 @@ class Renderer(object):
       board_image = self.player_info_board_images[i]
       
       board_image.blit(self.gui_images["info board"],(0,0))
-      board_image.blit(self.font_small.render(str(player.get_kills()),True,(0,0,0)),(45,0))
-      board_image.blit(self.font_small.render(str(player.get_wins()),True,(0,0,0)),(65,0))
-      board_image.blit(self.font_small.render(Game.COLOR_NAMES[i],True,Renderer.darken_color(Renderer.COLOR_RGB_VALUES[i],100)),(4,2))
+      board_image.blit(self.__get_plain_text_image(self.font_small,str(player.get_kills()),(0,0,0)),(45,0))
+      board_image.blit(self.__get_plain_text_image(self.font_small,str(player.get_wins()),(0,0,0)),(65,0))
+      board_image.blit(self.__get_plain_text_image(self.font_small,Game.COLOR_NAMES[i],Renderer.darken_color(Renderer.COLOR_RGB_VALUES[i],100)),(4,2))
       
       if player.is_dead():
         board_image.blit(self.gui_images["out"],(15,34))
@@ -3860,14 +4963,75 @@ class Renderer(object):
   #----------------------------------------------------------------------------
 
   def process_animation_events(self, animation_event_list):
+    unscaled_location = Renderer.get_map_render_position()
+    
     for animation_event in animation_event_list:
-      self.animations[animation_event[0]].play(animation_event[1])
+      position = animation_event[1]       # computed by map_position_to_pixel_position for the unscaled map
+      
+      if self.map_scale != 1.0:
+        position = (
+          self.map_render_location[0] + self.map_border_width + Renderer.scale_length(position[0] - unscaled_location[0] - Renderer.MAP_BORDER_WIDTH,self.map_scale),
+          self.map_render_location[1] + self.map_border_width + Renderer.scale_length(position[1] - unscaled_location[1] - Renderer.MAP_BORDER_WIDTH,self.map_scale))
+      
+      self.animations[animation_event[0]].play(position)
+
+  #----------------------------------------------------------------------------
+
+  ## Returns an image of a single-color piece of text rendered with outline.
+  #  Whole pieces are rendered at once so that font.render applies kerning,
+  #  the images are cached and mustn't be modified.
+
+  def __get_text_run_image(self, font, text_to_render, color, outline_color):
+    key = (font,text_to_render,color,outline_color)
+    
+    if key in self.text_run_cache:
+      self.text_run_cache[key] = self.text_run_cache.pop(key)   # move to the end as the most recently used
+      return self.text_run_cache[key]
+    
+    result = font.render(text_to_render,True,outline_color)   # create text with outline
+    result.blit(result,(0,2))
+    result.blit(result,(1,0))
+    result.blit(result,(-1,0))
+    result.blit(font.render(text_to_render,True,color),(0,1))
+    
+    self.text_run_cache[key] = result
+    
+    if len(self.text_run_cache) > Renderer.TEXT_CACHE_SIZE:
+      self.text_run_cache.popitem(last = False)
+    
+    return result
+
+  #----------------------------------------------------------------------------
+
+  ## Returns an image of text rendered by font.render (without outline and
+  #  formatting), the images are cached and mustn't be modified.
+
+  def __get_plain_text_image(self, font, text_to_render, color):
+    key = (font,text_to_render,color,None,False)
+    
+    if key in self.text_cache:
+      self.text_cache[key] = self.text_cache.pop(key)   # move to the end as the most recently used
+    else:
+      self.text_cache[key] = font.render(text_to_render,True,color)
+      
+      if len(self.text_cache) > Renderer.TEXT_CACHE_SIZE:
+        self.text_cache.popitem(last = False)
+    
+    return self.text_cache[key]
 
   #----------------------------------------------------------------------------
 
-  ## Renders text with outline, line breaks, formatting, etc.
+  ## Renders text with outline, line breaks, formatting, etc. The lines are
+  #  composed of cached single-color pieces and the whole rendered texts are
+  #  cached too, a new copy is returned so that the caller can modify it.
 
   def render_text(self, font, text_to_render, color, outline_color = (0,0,0), center = False):
+    key = (font,text_to_render,color,outline_color,center)
+    
+    if key in self.text_cache:
+      self.text_cache[key] = self.text_cache.pop(key)   # move to the end as the most recently used
+      return self.text_cache[key].copy()
+    
     text_lines = text_to_render.split("\n")
     rendered_lines = []
     
@@ -3885,6 +5049,8 @@ class Renderer(object):
 
       new_rendered_line = pygame.Surface(font.size(line_without_format),flags=pygame.SRCALPHA)
       
+      draw_list = []
+      
       x = 0
       first = True
       starts_with_format = line[0] == "^"
@@ -3899,18 +5065,14 @@ class Renderer(object):
         text_color = color
         
         if has_format:
-          text_color = pygame.Color(subline[:7])
+          text_color = tuple(pygame.Color(subline[:7]))
           subline = subline[7:]
         
-        new_rendered_subline = font.render(subline,True,outline_color)   # create text with outline
-        new_rendered_subline.blit(new_rendered_subline,(0,2))
-        new_rendered_subline.blit(new_rendered_subline,(1,0))
-        new_rendered_subline.blit(new_rendered_subline,(-1,0))
-        new_rendered_subline.blit(font.render(subline,True,text_color),(0,1))      
-        
-        new_rendered_line.blit(new_rendered_subline,(x,0))
-        
-        x += new_rendered_subline.get_size()[0]
+        subline_image = self.__get_text_run_image(font,subline,text_color,outline_color)
+        draw_list.append((subline_image,(x,0)))
+        x += subline_image.get_size()[0]
+      
+      new_rendered_line.blits(draw_list,doreturn = False)
         
       rendered_lines.append(new_rendered_line)
 
@@ -3929,7 +5091,12 @@ class Renderer(object):
     for i in range(len(rendered_lines)):
       result.blit(rendered_lines[i],(0 if not center else (width - rendered_lines[i].get_size()[0]) / 2,i * y_step))
     
-    return result
+    self.text_cache[key] = result
+    
+    if len(self.text_cache) > Renderer.TEXT_CACHE_SIZE:
+      self.text_cache.popitem(last = False)
+    
+    return result.copy()
 
   #----------------------------------------------------------------------------
 
@@ -3978,11 +5145,27 @@ class Renderer(object):
 
   #----------------------------------------------------------------------------
     
-  def render_menu(self, menu_to_render, game):
-    result = pygame.Surface(self.screen_resolution)
+  ## Returns a tuple of everything that affects the static part of the menu
+  #  image, the menu has to be composed again when it changes.
+
+  def __get_menu_state_key(self, menu_to_render, game):
+    items = tuple([tuple(column) for column in menu_to_render.get_items()])
+    map_preview_name = menu_to_render.get_selected_map_name() if isinstance(menu_to_render,MapSelectMenu) and menu_to_render.show_map_preview() else ""
+    
+    return (menu_to_render,menu_to_render.get_text(),items,menu_to_render.get_selected_item(),menu_to_render.get_scroll_position(),menu_to_render.get_state(),map_preview_name,self.screen_resolution)
+
+  #----------------------------------------------------------------------------
+
+  ## Draws the parts of the menu that don't change from frame to frame (that
+  #  is everything except for the selected item, confirm prompt and cursor,
+  #  unless the party cheat is on) and remembers the positions of the items in
+  #  self.menu_layout.
+
+  def __compose_menu(self, menu_to_render, game, result):
+    result.fill((0,0,0))
     
     if self.menu_background_image == None:
-      self.menu_background_image = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"gui_menu_background.png"))
+      self.menu_background_image = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"gui_menu_background.png"))
 
     background_position = (self.screen_center[0] - self.menu_background_image.get_size()[0] / 2,self.screen_center[1] - self.menu_background_image.get_size()[1] / 2)
       
@@ -3992,6 +5175,8 @@ class Renderer(object):
 
     profiler.measure_start("menu rend. party")
     if game.cheat_is_active(Game.CHEAT_PARTY):
+      self.load_game_images()                     # the party needs player and bomb images
+      
       for circle_info in self.party_circles:           # draw circles
         circle_coords = (self.screen_center[0] + circle_info[0][0],self.screen_center[1] + circle_info[0][1])     
         radius_coefficient = (math.sin(pygame.time.get_ticks() * circle_info[4] / 100.0 + circle_info[3]) + 1) / 2.0
@@ -4034,9 +5219,6 @@ class Renderer(object):
     
     result.blit(self.gui_images["version"],version_position)
     
-    profiler.measure_start("menu rend. item update")
-    self.update_menu_item_images(menu_to_render)
-    
     # render menu description text
     
     y = self.screen_center[1] + Renderer.MENU_DESCRIPTION_Y_OFFSET
@@ -4060,8 +5242,6 @@ class Renderer(object):
     
     items_y = y
     
-    profiler.measure_stop("menu rend. item update")
-    
     # render scrollbar if needed
     
     rows = 0
@@ -4078,39 +5258,92 @@ class Renderer(object):
       scrollbar_position = int(items_y + selected_coordinates[0] / float(rows) * Renderer.SCROLLBAR_HEIGHT)
       result.blit(self.gui_images["seeker"],(x,scrollbar_position))
     
-    mouse_coordinates = pygame.mouse.get_pos()
-    
-    # render items
+    # render items (the selected one is drawn each frame)
     
     profiler.measure_start("menu rend. items")
     
+    self.menu_layout = []       # (item coordinates, item image, center x, y) for each visible item
+    
     for j in range(len(menu_items)):
       y = items_y
       
       for i in range(min(Menu.MENU_MAX_ITEMS_VISIBLE,len(menu_items[j]) - menu_to_render.get_scroll_position())):
         item_image = self.menu_item_images[(j,i + menu_to_render.get_scroll_position())][1]
-
-        x = xs[j] - item_image.get_size()[0] / 2
-                
-        if (i + menu_to_render.get_scroll_position(),j) == selected_coordinates:
-          # item is selected
-          scale = (8 + math.sin(pygame.time.get_ticks() / 40.0)) / 7.0    # make the pulsating effect
-          item_image = pygame.transform.scale(item_image,(int(scale * item_image.get_size()[0]),int(scale * item_image.get_size()[1])))
-          x = xs[j] - item_image.get_size()[0] / 2
-          pygame.draw.rect(result,(255,0,0),pygame.Rect(x - 4,y - 2,item_image.get_size()[0] + 8,item_image.get_size()[1] + 4))
+        item_coordinates = (i + menu_to_render.get_scroll_position(),j)
         
-        result.blit(item_image,(x,y))
-        
-        # did mouse go over the item?
-        
-        if (not game.get_settings().control_by_mouse) and (self.previous_mouse_coordinates != mouse_coordinates) and (x <= mouse_coordinates[0] <= x + item_image.get_size()[0]) and (y <= mouse_coordinates[1] <= y + item_image.get_size()[1]):
-          item_coordinates = (i + menu_to_render.get_scroll_position(),j)
-          menu_to_render.mouse_went_over_item(item_coordinates)
+        self.menu_layout.append((item_coordinates,item_image,xs[j],y))
+                
+        if item_coordinates != selected_coordinates:
+          result.blit(item_image,(xs[j] - item_image.get_size()[0] / 2,y))
        
         y += Renderer.FONT_NORMAL_SIZE + Renderer.MENU_LINE_SPACING
     
     profiler.measure_stop("menu rend. items")
     
+    # map preview
+    
+    profiler.measure_start("menu rend. preview")
+    
+    if isinstance(menu_to_render,MapSelectMenu):       # also not too nice    
+      if menu_to_render.show_map_preview():
+        self.update_map_preview_image(menu_to_render.get_selected_map_name())
+        result.blit(self.preview_map_image,(self.screen_center[0] + 180,items_y))
+    
+    profiler.measure_stop("menu rend. preview")
+
+  #----------------------------------------------------------------------------
+    
+  ## Renders the menu into the frame surface (see update_frame_surface) and
+  #  returns it. The static part of the menu is cached, so that when nothing
+  #  changes, only the animated parts are redrawn (and only their rects have
+  #  to be updated on the display in dirty rects mode).
+    
+  def render_menu(self, menu_to_render, game):
+    result = self.frame_surface
+    
+    self.full_redraw_needed = True                # the map will have to be redrawn completely after the menu
+    
+    profiler.measure_start("menu rend. item update")
+    self.update_menu_item_images(menu_to_render)
+    profiler.measure_stop("menu rend. item update")
+    
+    menu_state_key = self.__get_menu_state_key(menu_to_render,game)
+    
+    if self.menu_static_image == None or self.menu_static_image.get_size() != self.screen_resolution:
+      self.menu_static_image = ImageCache.convert_surface(pygame.Surface(self.screen_resolution))
+      self.menu_state_key = None
+    
+    if game.cheat_is_active(Game.CHEAT_PARTY) or menu_state_key != self.menu_state_key:
+      self.__compose_menu(menu_to_render,game,self.menu_static_image)
+      result.blit(self.menu_static_image,(0,0))
+      self.menu_state_key = menu_state_key
+      self.dirty_rects = None
+    else:                                         # nothing has changed, just erase the animated parts
+      for rect in self.menu_animated_rects:
+        result.blit(self.menu_static_image,rect,rect)
+      
+      self.dirty_rects = list(self.menu_animated_rects) if self.dirty_rects_mode else None
+    
+    self.menu_animated_rects = []
+    
+    mouse_coordinates = pygame.mouse.get_pos()
+    selected_coordinates = menu_to_render.get_selected_item()
+    
+    for item_coordinates, item_image, center_x, y in self.menu_layout:
+      x = center_x - item_image.get_size()[0] / 2
+                
+      if item_coordinates == selected_coordinates:
+        scale = (8 + math.sin(pygame.time.get_ticks() / 40.0)) / 7.0    # make the pulsating effect
+        item_image = pygame.transform.scale(item_image,(int(scale * item_image.get_size()[0]),int(scale * item_image.get_size()[1])))
+        x = center_x - item_image.get_size()[0] / 2
+        self.menu_animated_rects.append(pygame.draw.rect(result,(255,0,0),pygame.Rect(x - 4,y - 2,item_image.get_size()[0] + 8,item_image.get_size()[1] + 4)))
+        self.menu_animated_rects.append(result.blit(item_image,(x,y)))
+        
+      # did mouse go over the item?
+        
+      if (not game.get_settings().control_by_mouse) and (self.previous_mouse_coordinates != mouse_coordinates) and (x <= mouse_coordinates[0] <= x + item_image.get_size()[0]) and (y <= mouse_coordinates[1] <= y + item_image.get_size()[1]):
+        menu_to_render.mouse_went_over_item(item_coordinates)
+    
     mouse_events = game.get_player_key_maps().get_mouse_button_events()
     
     for i in range(len(mouse_events)):
@@ -4127,7 +5360,7 @@ class Renderer(object):
       x = self.screen_center[0] - width / 2
       y = self.screen_center[1] - height / 2
       
-      pygame.draw.rect(result,(0,0,0),pygame.Rect(x,y,width,height))
+      self.menu_animated_rects.append(pygame.draw.rect(result,(0,0,0),pygame.Rect(x,y,width,height)))
       pygame.draw.rect(result,(255,255,255),pygame.Rect(x,y,width,height),1)
       
       text_image = pygame.transform.rotate(self.gui_images["prompt"],math.sin(pygame.time.get_ticks() / 100) * 5)
@@ -4135,23 +5368,15 @@ class Renderer(object):
       x = self.screen_center[0] - text_image.get_size()[0] / 2
       y = self.screen_center[1] - text_image.get_size()[1] / 2
       
-      result.blit(text_image,(x,y))
-    
-    # map preview
-    
-    profiler.measure_start("menu rend. preview")
-    
-    if isinstance(menu_to_render,MapSelectMenu):       # also not too nice    
-      if menu_to_render.show_map_preview():
-        self.update_map_preview_image(menu_to_render.get_selected_map_name())
-        result.blit(self.preview_map_image,(self.screen_center[0] + 180,items_y))
-    
-    profiler.measure_stop("menu rend. preview")
+      self.menu_animated_rects.append(result.blit(text_image,(x,y)))
     
     # draw cursor only if control by mouse is not allowed - wouldn't make sense
     
     if not game.get_settings().control_by_mouse:
-      result.blit(self.gui_images["cursor"],pygame.mouse.get_pos())
+      self.menu_animated_rects.append(result.blit(self.gui_images["cursor"],pygame.mouse.get_pos()))
+    
+    if self.dirty_rects != None:
+      self.dirty_rects.extend(self.menu_animated_rects)
     
     return result
 
@@ -4221,7 +5446,7 @@ class Renderer(object):
         y = tile_size * GameMap.MAP_HEIGHT + map_info_border_size
         column = 0
 
-        self.preview_map_image.blit(self.environment_images[temp_map.get_environment_name()][0],(0,y))
+        self.preview_map_image.blit(self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"tile_" + temp_map.get_environment_name() + "_floor.png")),(0,y))
 
         # draw starting item icons
 
@@ -4257,20 +5482,24 @@ class Renderer(object):
     debug_log("prerendering map...")
 
     # following images are only needed here, so we dont store them to self
-    image_trampoline = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_trampoline.png"))
-    image_teleport = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_teleport.png"))
-    image_arrow_up = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_arrow_up.png"))
-    image_arrow_right = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_arrow_right.png"))
-    image_arrow_down = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_arrow_down.png"))
-    image_arrow_left = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_arrow_left.png"))
-    image_lava = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_lava.png"))
-    image_background = pygame.image.load(os.path.join(Game.RESOURCE_PATH,"other_map_background.png"))
+    image_trampoline = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_trampoline.png"))
+    image_teleport = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_teleport.png"))
+    image_arrow_up = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_arrow_up.png"))
+    image_arrow_right = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_arrow_right.png"))
+    image_arrow_down = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_arrow_down.png"))
+    image_arrow_left = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_arrow_left.png"))
+    image_lava = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_lava.png"))
+    image_background = self.image_cache.load(os.path.join(Game.RESOURCE_PATH,"other_map_background.png"))
+
+    if self.map_scale != 1.0:
+      image_trampoline, image_teleport, image_arrow_up, image_arrow_right, image_arrow_down, image_arrow_left, image_lava = [Renderer.scale_image(image,self.map_scale) for image in (image_trampoline,image_teleport,image_arrow_up,image_arrow_right,image_arrow_down,image_arrow_left,image_lava)]
+      image_background = pygame.transform.smoothscale(image_background,self.prerendered_map_background.get_size()) if image_background.get_bitsize() in (24,32) else pygame.transform.scale(image_background,self.prerendered_map_background.get_size())
 
     self.prerendered_map_background.blit(image_background,(0,0))
 
     for j in range(GameMap.MAP_HEIGHT):
       for i in range(GameMap.MAP_WIDTH):
-        render_position = (i * Renderer.MAP_TILE_WIDTH + Renderer.MAP_BORDER_WIDTH,j * Renderer.MAP_TILE_HEIGHT + + Renderer.MAP_BORDER_WIDTH)          
+        render_position = (i * self.tile_width + self.map_border_width,j * self.tile_height + self.map_border_width)          
         self.prerendered_map_background.blit(self.environment_images[map_to_render.get_environment_name()][0],render_position)
        
         tile = map_to_render.get_tile_at((i,j))
@@ -4296,6 +5525,62 @@ class Renderer(object):
     self.prerendered_map_background.blit(game_info_text,((self.prerendered_map_background.get_size()[0] - game_info_text.get_size()[0]) / 2,self.prerendered_map_background.get_size()[1] - game_info_text.get_size()[1]))
 
     self.prerendered_map = map_to_render
+    self.block_layer_rows = [None for i in range(GameMap.MAP_HEIGHT)]
+
+  #----------------------------------------------------------------------------
+
+  ## Returns an image of the blocks and walls in given map row (the image
+  #  starts at the row's left side and ends at its bottom, blocks can be
+  #  higher than a tile). The images are cached until the row changes.
+
+  def __get_block_layer_row(self, map_to_render, row):
+    version = map_to_render.get_block_layer_version(row)
+    
+    if self.block_layer_rows[row] != None and self.block_layer_rows[row][0] == version:
+      return self.block_layer_rows[row][1]
+    
+    environment_images = self.environment_images[map_to_render.get_environment_name()]
+    
+    height = max(self.tile_height,environment_images[1].get_height(),environment_images[2].get_height())
+    width = (GameMap.MAP_WIDTH - 1) * self.tile_width + max(self.tile_width,environment_images[1].get_width(),environment_images[2].get_width())
+    
+    row_image = ImageCache.convert_surface(pygame.Surface((width,height),flags=pygame.SRCALPHA))
+    row_image.fill((0,0,0,0))
+    
+    for x in reversed(range(GameMap.MAP_WIDTH)):   # from right to left, like the tiles are drawn
+      tile = map_to_render.get_tile_at((x,row))
+      
+      if tile.to_be_destroyed or tile.kind == MapTile.TILE_FLOOR:
+        continue
+      
+      tile_image = environment_images[1] if tile.kind == MapTile.TILE_BLOCK else environment_images[2]
+      row_image.blit(tile_image,(x * self.tile_width,height - tile_image.get_height()))
+    
+    self.block_layer_rows[row] = (version,row_image)
+    
+    return row_image
+
+  #----------------------------------------------------------------------------
+
+  ## Returns the player sprite of given color scaled for a jump (scale step 0
+  #  means normal size, JUMP_SPRITE_SCALE_STEPS means 1.5 times bigger). Scaled
+  #  sprites are cached, the least recently used ones are dropped.
+
+  def __get_jump_sprite(self, color_index, scale_step):
+    key = (color_index,scale_step)
+    
+    if key in self.jump_sprite_cache:
+      image = self.jump_sprite_cache.pop(key)   # will be inserted again as the most recently used
+    else:
+      player_image = self.player_images[color_index]["down"]
+      scale = 1 + 0.5 * scale_step / float(Renderer.JUMP_SPRITE_SCALE_STEPS)
+      image = pygame.transform.scale(player_image,(int(scale * player_image.get_size()[0]),int(scale * player_image.get_size()[1])))
+      
+      if len(self.jump_sprite_cache) >= Renderer.JUMP_SPRITE_CACHE_SIZE:
+        self.jump_sprite_cache.popitem(last = False)
+        
+    self.jump_sprite_cache[key] = image
+    return image
 
   #----------------------------------------------------------------------------
 
@@ -4312,7 +5597,7 @@ class Renderer(object):
       profiler.measure_stop("map rend. player")
       return (None, (0,0), (0,0), False, [])
         
-    sprite_center = Renderer.PLAYER_SPRITE_CENTER
+    sprite_center = self.player_sprite_center
     animation_frame = (player.get_state_time() / 100) % 4
     color_index = player.get_number() if game_map.get_state() == GameMap.STATE_WAITING_TO_PLAY else player.get_team_number()
 
@@ -4322,14 +5607,11 @@ class Renderer(object):
       else:
         quotient = 2.0 - abs(player.get_state_time() / float(Player.JUMP_DURATION / 2))
               
-      scale = (1 + 0.5 * quotient)
-              
-      player_image = self.player_images[color_index]["down"]
-      image_to_render = pygame.transform.scale(player_image,(int(scale * player_image.get_size()[0]),int(scale * player_image.get_size()[1])))
+      image_to_render = self.__get_jump_sprite(color_index,int(round(quotient * Renderer.JUMP_SPRITE_SCALE_STEPS)))
       draw_shadow = False
               
-      relative_offset[0] = -1 * (image_to_render.get_size()[0] / 2 - Renderer.PLAYER_SPRITE_CENTER[0])                   # offset caused by scale  
-      relative_offset[1] = -1 * int(math.sin(quotient * math.pi / 2.0) * Renderer.MAP_TILE_HEIGHT * GameMap.MAP_HEIGHT)  # height offset
+      relative_offset[0] = -1 * (image_to_render.get_size()[0] / 2 - sprite_center[0])                            # offset caused by scale  
+      relative_offset[1] = -1 * int(math.sin(quotient * math.pi / 2.0) * self.tile_height * GameMap.MAP_HEIGHT)  # height offset
 
     elif player.is_teleporting():
       image_to_render = self.player_images[color_index][("up","right","down","left")[animation_frame]]
@@ -4364,7 +5646,7 @@ class Renderer(object):
 
   def __get_bomb_render_info(self, bomb, game_map):
     profiler.measure_start("map rend. bomb")
-    sprite_center = Renderer.BOMB_SPRITE_CENTER
+    sprite_center = self.bomb_sprite_center
     animation_frame = (bomb.time_of_existence / 100) % 4
     relative_offset = [0,0]   
     overlay_images = []      
@@ -4381,10 +5663,10 @@ class Renderer(object):
       helper_offset = -1 * bomb.flight_info.total_distance_to_travel + bomb.flight_info.distance_travelled
             
       relative_offset = [
-        int(bomb.flight_info.direction[0] * helper_offset * Renderer.MAP_TILE_WIDTH),
-        int(bomb.flight_info.direction[1] * helper_offset * Renderer.MAP_TILE_HALF_HEIGHT)]
+        int(bomb.flight_info.direction[0] * helper_offset * self.tile_width),
+        int(bomb.flight_info.direction[1] * helper_offset * (self.tile_height / 2))]
 
-      relative_offset[1] -= int(math.sin(normalised_distance_travelled * math.pi) * bomb.flight_info.total_distance_to_travel * Renderer.MAP_TILE_HEIGHT / 2)  # height in air
+      relative_offset[1] -= int(math.sin(normalised_distance_travelled * math.pi) * bomb.flight_info.total_distance_to_travel * self.tile_height / 2)  # height in air
           
     image_to_render = self.bomb_images[animation_frame]
           
@@ -4397,11 +5679,46 @@ class Renderer(object):
 
   #----------------------------------------------------------------------------
 
-  def render_map(self, map_to_render):
-    result = pygame.Surface(self.screen_resolution)
+  ## Returns the position at which given player or bomb is rendered: its
+  #  position interpolated between the previous simulation step (given by
+  #  previous_positions, object : position) and the current one.
+
+  @staticmethod
+  def get_interpolated_position(what, previous_positions, interpolation):
+    position = what.get_position()
+    
+    if previous_positions == None or interpolation >= 1.0 or not what in previous_positions:
+      return position
+    
+    previous_position = previous_positions[what]
+    
+    if abs(position[0] - previous_position[0]) > 1 or abs(position[1] - previous_position[1]) > 1:   # teleport or going through map edge, don't interpolate
+      return position
+    
+    return (
+      previous_position[0] + (position[0] - previous_position[0]) * interpolation,
+      previous_position[1] + (position[1] - previous_position[1]) * interpolation)
+
+  #----------------------------------------------------------------------------
+
+  ## Renders the map into the frame surface (see update_frame_surface) and
+  #  returns it. Players and bombs are drawn between their previous_positions
+  #  (object : position, positions before the last simulation step) and
+  #  their current positions according to interpolation (0.0 to 1.0).
+
+  def render_map(self, map_to_render, previous_positions = None, interpolation = 1.0):
+    self.load_game_images()
+    
+    result = self.frame_surface
+    result.fill((0,0,0))
+    
+    frame_rects = []                              # rects of the dynamic things drawn in this frame
+    changed_rects = []                            # rects that changed since the previous frame
     
     self.menu_background_image = None             # unload unneccessarry images
     self.menu_item_images = None
+    self.menu_static_image = None
+    self.menu_state_key = None
     self.preview_map_name = ""
     self.preview_map_image = None
     
@@ -4409,6 +5726,7 @@ class Renderer(object):
   
     if map_to_render != self.prerendered_map:     # first time rendering this map, prerender some stuff
       self.__prerender_map(map_to_render)
+      self.full_redraw_needed = True
 
     profiler.measure_start("map rend. backg.")
     result.blit(self.prerendered_map_background,self.map_render_location)
@@ -4420,7 +5738,8 @@ class Renderer(object):
     ordered_objects_to_render = []
     ordered_objects_to_render.extend(map_to_render.get_players())
     ordered_objects_to_render.extend(map_to_render.get_bombs())
-    ordered_objects_to_render.sort(key = lambda what: 1000 if (isinstance(what,Bomb) and what.movement == Bomb.BOMB_FLYING) else what.get_position()[1])   # flying bombs are rendered above everything else
+    render_positions = dict((what,Renderer.get_interpolated_position(what,previous_positions,interpolation)) for what in ordered_objects_to_render)
+    ordered_objects_to_render.sort(key = lambda what: 1000 if (isinstance(what,Bomb) and what.movement == Bomb.BOMB_FLYING) else render_positions[what][1])   # flying bombs are rendered above everything else
     profiler.measure_stop("map rend. sort")
     
     # render the map by lines:
@@ -4428,17 +5747,21 @@ class Renderer(object):
     tiles = map_to_render.get_tiles()
     environment_images = self.environment_images[map_to_render.get_environment_name()]
     
-    y = Renderer.MAP_BORDER_WIDTH + self.map_render_location[1]
-    y_offset_block = Renderer.MAP_TILE_HEIGHT - environment_images[1].get_size()[1]
-    y_offset_wall = Renderer.MAP_TILE_HEIGHT - environment_images[2].get_size()[1]
+    y = self.map_border_width + self.map_render_location[1]
+    y_offset_block = self.tile_height - environment_images[1].get_size()[1]
+    y_offset_wall = self.tile_height - environment_images[2].get_size()[1]
     
     line_number = 0
     object_to_render_index = 0
     
+    draw_list = []           # (image, position) pairs in the order in which they're drawn, drawn with one blits call
+    
+    profiler.measure_start("map rend. draw list")
+    
     flame_animation_frame = (pygame.time.get_ticks() / 100) % 2
     
     for line in tiles:
-      x = (GameMap.MAP_WIDTH - 1) * Renderer.MAP_TILE_WIDTH + Renderer.MAP_BORDER_WIDTH + self.map_render_location[0]
+      x = (GameMap.MAP_WIDTH - 1) * self.tile_width + self.map_border_width + self.map_render_location[0]
       
       while True:                  # render players and bombs in the current line 
         if object_to_render_index >= len(ordered_objects_to_render):
@@ -4446,7 +5769,7 @@ class Renderer(object):
         
         object_to_render = ordered_objects_to_render[object_to_render_index]
         
-        if object_to_render.get_position()[1] > line_number + 1:
+        if render_positions[object_to_render][1] > line_number + 1:
           break
         
         if isinstance(object_to_render,Player):
@@ -4459,56 +5782,99 @@ class Renderer(object):
           continue
 
         if draw_shadow:
-          render_position = self.tile_position_to_pixel_position(object_to_render.get_position(),Renderer.SHADOW_SPRITE_CENTER)
+          render_position = self.tile_position_to_pixel_position(render_positions[object_to_render],self.shadow_sprite_center)
           render_position = (
-            (render_position[0] + Renderer.MAP_BORDER_WIDTH + relative_offset[0]) % self.prerendered_map_background.get_size()[0] + self.map_render_location[0],
-            render_position[1] + Renderer.MAP_BORDER_WIDTH + self.map_render_location[1])
+            (render_position[0] + self.map_border_width + relative_offset[0]) % self.prerendered_map_background.get_size()[0] + self.map_render_location[0],
+            render_position[1] + self.map_border_width + self.map_render_location[1])
 
-          result.blit(self.other_images["shadow"],render_position)
+          draw_list.append((self.other_images["shadow"],render_position))
+          frame_rects.append(pygame.Rect(render_position,self.other_images["shadow"].get_size()))
         
-        render_position = self.tile_position_to_pixel_position(object_to_render.get_position(),sprite_center)
-        render_position = ((render_position[0] + Renderer.MAP_BORDER_WIDTH + relative_offset[0]) % self.prerendered_map_background.get_size()[0] + self.map_render_location[0],render_position[1] + Renderer.MAP_BORDER_WIDTH + relative_offset[1] + self.map_render_location[1])
+        render_position = self.tile_position_to_pixel_position(render_positions[object_to_render],sprite_center)
+        render_position = ((render_position[0] + self.map_border_width + relative_offset[0]) % self.prerendered_map_background.get_size()[0] + self.map_render_location[0],render_position[1] + self.map_border_width + relative_offset[1] + self.map_render_location[1])
         
-        result.blit(image_to_render,render_position)
+        draw_list.append((image_to_render,render_position))
+        frame_rects.append(pygame.Rect(render_position,image_to_render.get_size()))
         
         for additional_image in overlay_images:
-          result.blit(additional_image,render_position)
+          draw_list.append((additional_image,render_position))
+          frame_rects.append(pygame.Rect(render_position,additional_image.get_size()))
       
         object_to_render_index += 1
             
-      for tile in reversed(line):             # render tiles in the current line
-        profiler.measure_start("map rend. tiles")
+      for tile in reversed(line):             # render items and flames in the current line
+        tile_image = None
         
         if not tile.to_be_destroyed:          # don't render a tile that is being destroyed
           if tile.kind == MapTile.TILE_BLOCK:
-            result.blit(environment_images[1],(x,y + y_offset_block))
+            tile_image = environment_images[1]
+            tile_image_position = (x,y + y_offset_block)
           elif tile.kind == MapTile.TILE_WALL:
-            result.blit(environment_images[2],(x,y + y_offset_wall))
+            tile_image = environment_images[2]
+            tile_image_position = (x,y + y_offset_wall)
           elif tile.item != None:
-            result.blit(self.item_images[tile.item],(x,y))
+            tile_image = self.item_images[tile.item]
+            tile_image_position = (x,y)
+            draw_list.append((tile_image,tile_image_position))
+
+        flame_image = None
 
         if len(tile.flames) != 0:             # if there is at least one flame, draw it
           sprite_name = tile.flames[0].direction
-          result.blit(self.flame_images[flame_animation_frame][sprite_name],(x,y))
+          flame_image = self.flame_images[flame_animation_frame][sprite_name]
+          draw_list.append((flame_image,(x,y)))
+
+        if self.dirty_rects_mode:             # check if the tile looks different than in previous frame
+          tile_rect = pygame.Rect(x,y,self.tile_width,self.tile_height)
+          
+          if tile_image != None:
+            tile_rect.union_ip(pygame.Rect(tile_image_position,tile_image.get_size()))
+            
+          if flame_image != None:
+            tile_rect.union_ip(pygame.Rect((x,y),flame_image.get_size()))
+          
+          previous_tile_state = self.tile_render_states[tile.index]
+          
+          if previous_tile_state == None or previous_tile_state[0] != (tile_image,flame_image):
+            changed_rects.append(tile_rect)
+          
+            if previous_tile_state != None:
+              changed_rects.append(previous_tile_state[1])
+          
+          self.tile_render_states[tile.index] = ((tile_image,flame_image),tile_rect)
 
       # for debug: uncomment this to see danger values on the map
       # pygame.draw.rect(result,(int((1 - map_to_render.get_danger_value(tile.coordinates) / float(GameMap.SAFE_DANGER_VALUE)) * 255.0),0,0),pygame.Rect(x + 10,y + 10,30,30))
 
-        x -= Renderer.MAP_TILE_WIDTH
+        x -= self.tile_width
   
-        profiler.measure_stop("map rend. tiles")
+      # blocks and walls of the line are drawn with one cached image, they only overlap the items and flames of the line from above
   
-      x = (GameMap.MAP_WIDTH - 1) * Renderer.MAP_TILE_WIDTH + Renderer.MAP_BORDER_WIDTH + self.map_render_location[0]
+      block_layer_row = self.__get_block_layer_row(map_to_render,line_number)
+      draw_list.append((block_layer_row,(self.map_border_width + self.map_render_location[0],y + self.tile_height - block_layer_row.get_height())))
   
-      y += Renderer.MAP_TILE_HEIGHT
+      x = (GameMap.MAP_WIDTH - 1) * self.tile_width + self.map_border_width + self.map_render_location[0]
+  
+      y += self.tile_height
       line_number += 1
       
+    profiler.measure_stop("map rend. draw list")
+      
+    profiler.measure_start("map rend. blits")
+    result.blits(draw_list,doreturn = False)
+    profiler.measure_stop("map rend. blits")
+      
     # update animations
     
     profiler.measure_start("map rend. anim")
     
+    draw_list = []
+    
     for animation_index in self.animations:
-      self.animations[animation_index].draw(result)
+      draw_list.extend(self.animations[animation_index].get_draw_list())
+    
+    result.blits(draw_list,doreturn = False)
+    frame_rects.extend([pygame.Rect(item[1],item[0].get_size()) for item in draw_list])
     
     profiler.measure_stop("map rend. anim")
       
@@ -4520,6 +5886,8 @@ class Renderer(object):
       
     x = self.map_render_location[0] + 12
     y = self.map_render_location[1] + self.prerendered_map_background.get_size()[1] + 20
+    
+    draw_list = []
       
     for i in players_by_numbers:
       if players_by_numbers[i] == None or self.player_info_board_images[i] == None:
@@ -4530,17 +5898,26 @@ class Renderer(object):
       else:
         movement_offset = (int(math.sin(pygame.time.get_ticks() / 64.0 + i) * 2),int(4 * math.sin(pygame.time.get_ticks() / 128.0 - i)))
         
-      result.blit(self.player_info_board_images[i],(x + movement_offset[0],y + movement_offset[1]))
+      draw_list.append((self.player_info_board_images[i],(x + movement_offset[0],y + movement_offset[1])))
         
       x += self.gui_images["info board"].get_size()[0] - 2
 
+    result.blits(draw_list,doreturn = False)
+    frame_rects.extend([pygame.Rect(item[1],item[0].get_size()) for item in draw_list])
+
     profiler.measure_stop("map rend. boards")
 
     profiler.measure_start("map rend. earthquake")
 
-    if map_to_render.earthquake_is_active(): # shaking effect
-      random_scale = random.uniform(0.99,1.01)
-      result = pygame.transform.rotate(result,random.uniform(-4,4))
+    earthquake_is_active = map_to_render.earthquake_is_active()
+
+    if earthquake_is_active: # shaking effect
+      shake_offset = (random.randint(-Renderer.EARTHQUAKE_SHAKE,Renderer.EARTHQUAKE_SHAKE),random.randint(-Renderer.EARTHQUAKE_SHAKE,Renderer.EARTHQUAKE_SHAKE))
+      result.scroll(shake_offset[0],shake_offset[1])   # moves the image in place, so no new surface is needed
+      
+      # clear the strips uncovered by the move:
+      result.fill((0,0,0),pygame.Rect(0 if shake_offset[0] > 0 else result.get_width() + shake_offset[0],0,abs(shake_offset[0]),result.get_height()))
+      result.fill((0,0,0),pygame.Rect(0,0 if shake_offset[1] > 0 else result.get_height() + shake_offset[1],result.get_width(),abs(shake_offset[1])))
    
     profiler.measure_stop("map rend. earthquake")
    
@@ -4551,7 +5928,19 @@ class Renderer(object):
       countdown_image = self.gui_images["countdown"][countdown_image_index]
       countdown_position = (self.screen_center[0] - countdown_image.get_size()[0] / 2,self.screen_center[1] - countdown_image.get_size()[1] / 2)
       
-      result.blit(countdown_image,countdown_position)
+      frame_rects.append(result.blit(countdown_image,countdown_position))
+   
+    # find out what changed on the screen
+   
+    if not self.dirty_rects_mode or self.full_redraw_needed or earthquake_is_active or self.earthquake_was_active:
+      self.dirty_rects = None
+    else:
+      screen_rect = result.get_rect()
+      self.dirty_rects = [rect.clip(screen_rect) for rect in changed_rects + self.previous_frame_rects + frame_rects]    # previous rects have to be updated too, to erase the old images
+   
+    self.previous_frame_rects = frame_rects
+    self.earthquake_was_active = earthquake_is_active
+    self.full_redraw_needed = False
    
     return result    
 
@@ -4573,7 +5962,10 @@ class AI(object):
     self.recompute_compute_actions_on = 0
     
     self.do_nothing = False     ##< this can turn AI off for debugging purposes
-    self.didnt_move_since = 0 
+    self.didnt_move_since = 0
+    
+    # AI has its own generator so that it doesn't affect the map's random decisions:
+    self.random = random.Random(game_map.get_seed() * 10 + player.get_number()) 
 
   #----------------------------------------------------------------------------
    
@@ -4769,7 +6161,7 @@ class AI(object):
     
     if trapped:
       # in case the player is trapped spin randomly and press box in hope to free itself
-      chosen_movement_action = random.choice((PlayerKeyMaps.ACTION_UP,PlayerKeyMaps.ACTION_RIGHT,PlayerKeyMaps.ACTION_DOWN,PlayerKeyMaps.ACTION_LEFT))
+      chosen_movement_action = self.random.choice((PlayerKeyMaps.ACTION_UP,PlayerKeyMaps.ACTION_RIGHT,PlayerKeyMaps.ACTION_DOWN,PlayerKeyMaps.ACTION_LEFT))
     elif self.game_map.tile_has_bomb(current_tile):
       # standing on a bomb, find a way to escape
       
@@ -4797,150 +6189,725 @@ class AI(object):
       maximum_score = self.rate_tile(current_tile)
       best_direction_actions = [None]
     
-      general_direction = self.decide_general_direction()
+      general_direction = self.decide_general_direction()
+
+                       # up                     # right                     # down                     # left
+      tile_increment  = ((0,-1),                  (1,0),                      (0,1),                     (-1,0))
+      action =          (PlayerKeyMaps.ACTION_UP, PlayerKeyMaps.ACTION_RIGHT, PlayerKeyMaps.ACTION_DOWN, PlayerKeyMaps.ACTION_LEFT)
+    
+      # should I move up, right, down or left?
+    
+      for direction in (0,1,2,3):
+        score = self.rate_tile((current_tile[0] + tile_increment[direction][0],current_tile[1] + tile_increment[direction][1]))  
+      
+        # count in the general direction
+        extra_score = 0
+        
+        if tile_increment[direction][0] == general_direction[0]:
+          extra_score += 2
+        
+        if tile_increment[direction][1] == general_direction[1]:
+          extra_score += 2
+          
+        score += extra_score
+      
+        if score > maximum_score:
+          maximum_score = score
+          best_direction_actions = [action[direction]]
+        elif score == maximum_score:
+          best_direction_actions.append(action[direction])
+      
+      chosen_movement_action = self.random.choice(best_direction_actions)
+      
+    if chosen_movement_action != None:
+      if self.player.get_disease() == Player.DISEASE_REVERSE_CONTROLS:
+        chosen_movement_action = PlayerKeyMaps.get_opposite_action(chosen_movement_action)
+      
+      self.outputs.append((self.player.get_number(),chosen_movement_action))
+      
+      self.didnt_move_since = self.game_map.get_map_time()
+
+    if self.game_map.get_map_time() - self.didnt_move_since > 10000:   # didn't move for 10 seconds or more => force move
+      chosen_movement_action = self.random.choice((PlayerKeyMaps.ACTION_UP,PlayerKeyMaps.ACTION_RIGHT,PlayerKeyMaps.ACTION_DOWN,PlayerKeyMaps.ACTION_LEFT))
+      self.outputs.append((self.player.get_number(),chosen_movement_action))
+      
+    # bomb decisions
+    
+    bomb_laid = False
+    
+    if self.game_map.tile_has_bomb(current_tile):
+      # should I throw?
+      
+      if self.player.can_throw() and max(escape_direction_ratings) == 0:
+        self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_BOMB_DOUBLE))
+    elif self.player.get_bombs_left() > 0 and (self.player.can_throw() or self.game_map.get_danger_value(current_tile) > 2000 and max(escape_direction_ratings) > 0): 
+      # should I lay bomb?
+      
+      chance_to_put_bomb = 100    # one in how many
+      
+      players_near = self.players_nearby()
+      
+      if players_near[0] > 0 and players_near[1] == 0:  # enemy nearby and no ally nearby
+        chance_to_put_bomb = 5
+      else:
+        block_tile_ratio = self.game_map.get_number_of_block_tiles() / float(GameMap.MAP_WIDTH * GameMap.MAP_HEIGHT)
+
+        if block_tile_ratio < 0.4:   # if there is not many tiles left, put bombs more often
+          chance_to_put_bomb = 80
+        elif block_tile_ratio < 0.2:
+          chance_to_put_bomb = 20
+      
+      number_of_block_neighbours = self.number_of_blocks_next_to_tile(current_tile)
+     
+      if number_of_block_neighbours == 1:
+        chance_to_put_bomb = 3
+      elif number_of_block_neighbours == 2 or number_of_block_neighbours == 3:
+        chance_to_put_bomb = 2
+      
+      do_lay_bomb = self.random.randint(0,chance_to_put_bomb) == 0
+      
+      if do_lay_bomb:
+        bomb_laid = True
+        
+        if self.random.randint(0,2) == 0 and self.should_lay_multibomb(chosen_movement_action):  # lay a single bomb or multibomb?
+          self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_BOMB_DOUBLE))
+        else:
+          self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_BOMB))
+  
+    # should I box?
+    
+    if self.player.can_box() and not self.player.detonator_is_active():
+      if trapped or self.game_map.tile_has_bomb(self.player.get_forward_tile_position()):
+        self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_SPECIAL))
+  
+    if bomb_laid:   # if bomb was laid, the outputs must be recomputed fast in order to prevent laying bombs to other tiles
+      self.recompute_compute_actions_on = current_time + 10
+    else:
+      self.recompute_compute_actions_on = current_time + self.random.randint(AI.REPEAT_ACTIONS[0],AI.REPEAT_ACTIONS[1])
+
+    # should I detonate the detonator?
+    
+    if self.player.detonator_is_active():
+      if self.random.randint(0,2) == 0 and self.game_map.get_danger_value(current_tile) >= GameMap.SAFE_DANGER_VALUE:
+        self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_SPECIAL))
+  
+    return self.outputs
+
+  #----------------------------------------------------------------------------
+
+  def should_lay_multibomb(self, movement_action):
+    if self.player.can_throw():    # multibomb not possible with throwing glove
+      return False
+    
+    multibomb_count = self.player.get_multibomb_count()
+    
+    if multibomb_count > 1:        # multibomb possible
+      current_tile = self.player.get_tile_position()
+
+      player_direction = movement_action if movement_action != None else self.player.get_direction_number()
+
+      # by laying multibomb one of the escape routes will be cut off, let's check
+      # if there would be any escape routes left
+      
+      escape_direction_ratings = list(self.rate_bomb_escape_directions(current_tile))
+      escape_direction_ratings[player_direction] = 0
+      
+      if max(escape_direction_ratings) == 0:
+        return False
+
+      direction_vector = self.player.get_direction_vector()
+      
+      multibomb_safe = True
+      
+      for i in range(multibomb_count):
+        if not self.game_map.tile_is_walkable(current_tile) or not self.game_map.tile_is_withing_map(current_tile):
+          break
+        
+        if self.game_map.get_danger_value(current_tile) < 3000 or self.game_map.tile_has_lava(current_tile):
+          multibomb_safe = False
+          break
+        
+        current_tile = (current_tile[0] + direction_vector[0],current_tile[1] + direction_vector[1])
+        
+      if multibomb_safe:
+        return True
+      
+    return False
+
+#==============================================================================
+
+## Runs a game on a GameMap with AI players without any display, sound or font
+#  initialisation. Everything is driven only by the simulated map time, so the
+#  game can be simulated as fast as the CPU allows (e.g. for AI testing).
+
+class Simulation(object):
+  DEFAULT_DT = 20                 ##< time step (in ms) that run() uses
+  MAX_MAP_TIME = 600000           ##< map time (in ms) after which run() gives up the game
+
+  #----------------------------------------------------------------------------
+
+  ## If with_ais is False, the AI players don't get any AI and only do what
+  #  the input actions passed to step() say (used for replay playback).
+
+  def __init__(self, map_data, play_setup, game_number = 1, max_games = 1, all_items_cheat = False, seed = None, with_ais = True):
+    self.game_map = GameMap(map_data,play_setup,game_number,max_games,all_items_cheat,seed)
+    self.immortal_player_numbers = []
+    self.ais = []
+    self.replay = None            ##< if not None, the steps are recorded into this Replay
+    self.keep_events = False      ##< if True, sound and animation events are left in the map for someone to play them
+    
+    player_slots = play_setup.get_slots()
+    players_by_numbers = self.game_map.get_players_by_numbers()
+    
+    for i in range(len(player_slots)):
+      if with_ais and player_slots[i] != None and player_slots[i][0] < 0:  # indicates AI
+        self.ais.append(AI(players_by_numbers[i],self.game_map))
+
+  #----------------------------------------------------------------------------
+  
+  def get_map(self):
+    return self.game_map
+
+  #----------------------------------------------------------------------------
+  
+  def is_over(self):
+    return self.game_map.get_state() == GameMap.STATE_GAME_OVER
+
+  #----------------------------------------------------------------------------
+  
+  ## Simulates one step of the game, input_actions are the actions of non-AI
+  #  players in the format returned by PlayerKeyMaps.get_current_actions().
+  
+  def step(self, dt, input_actions = []):
+    actions_being_performed = list(input_actions)
+    
+    for ai in self.ais:
+      actions_being_performed = actions_being_performed + ai.play()
+    
+    if self.replay != None:
+      self.replay.record_frame(dt,actions_being_performed)
+    
+    for player in self.game_map.get_players():
+      player.react_to_inputs(actions_being_performed,dt,self.game_map)
+      
+    self.game_map.update(dt,self.immortal_player_numbers)
+    
+    if not self.keep_events:
+      # there is no one to play the sounds and animations, so don't let them pile up
+      self.game_map.get_and_clear_sound_events()
+      self.game_map.get_and_clear_animation_events()
+
+  #----------------------------------------------------------------------------
+  
+  ## Simulates the game until it is over and returns the winner team number
+  #  (-1 means a draw). If the game isn't over after max_map_time ms, it is
+  #  considered a draw.
+  
+  def run(self, dt = DEFAULT_DT, max_map_time = MAX_MAP_TIME):
+    while not self.is_over():
+      if self.game_map.get_map_time() >= max_map_time:
+        return -1
+      
+      self.step(dt)
+      
+    return self.game_map.get_winner_team()
+
+## Plays one AI-only tournament match, this is a module-level function so
+#  that it can be sent to worker processes. match_setup is a tuple in format
+#  (map_name, map_data, player_slots, seed), returns a tuple in format
+#  (map_name, winner_team, map_time, list of (player_number, kills)).
+
+def play_tournament_match(match_setup):
+  play_setup = PlaySetup()
+  play_setup.player_slots = match_setup[2]
+  
+  simulation = Simulation(match_setup[1],play_setup,seed=match_setup[3])
+  winner_team = simulation.run()
+  
+  kills = [(player.get_number(),player.get_kills()) for player in simulation.get_map().get_players()]
+  
+  return (match_setup[0],winner_team,simulation.get_map().get_map_time(),kills)
+
+#==============================================================================
+
+## Plays many AI-only matches in parallel on all CPU cores and sums up the
+#  results (used by the --tournament command line option).
+
+class Tournament(object):
+  DEFAULT_NUMBER_OF_MATCHES = 20
+
+  #----------------------------------------------------------------------------
+
+  ## player_slots are in the same format as in PlaySetup, but only AI players
+  #  are allowed.
+
+  def __init__(self, map_names, player_slots, number_of_matches = DEFAULT_NUMBER_OF_MATCHES):
+    self.map_names = map_names
+    self.player_slots = player_slots
+    self.number_of_matches = number_of_matches
+    
+    self.players = []           ##< players holding the total kills and wins
+    
+    for i in range(len(player_slots)):
+      if player_slots[i] != None:
+        player = Player()
+        player.set_number(i)
+        player.set_team_number(player_slots[i][1])
+        self.players.append(player)
+
+  #----------------------------------------------------------------------------
+
+  ## Makes a tournament from command line arguments:
+  #  --maps name,name,...   maps to play (default: all maps)
+  #  --matches n            number of matches to play
+  #  --slots t,t,-,t,...    team number for each player slot, "-" = empty slot
+
+  @staticmethod
+  def from_command_line(arguments):
+    map_names = get_argument_value(arguments,"--maps")
+    
+    if map_names != None:
+      map_names = map_names.split(",")
+    else:
+      map_names = sorted([filename for filename in os.listdir(Game.MAP_PATH) if os.path.isfile(os.path.join(Game.MAP_PATH,filename))])
+    
+    number_of_matches = get_argument_value(arguments,"--matches")
+    number_of_matches = int(number_of_matches) if number_of_matches != None else Tournament.DEFAULT_NUMBER_OF_MATCHES
+    
+    player_slots = [((-1,i) if i < 4 else None) for i in range(10)]
+    slots_value = get_argument_value(arguments,"--slots")
+    
+    if slots_value != None:
+      player_slots = [None for i in range(10)]
+      
+      for i, team in enumerate(slots_value.split(",")[:10]):
+        if team.strip() != "-":
+          player_slots[i] = (-1,int(team))
+    
+    return Tournament(map_names,player_slots,number_of_matches)
+
+  #----------------------------------------------------------------------------
+
+  def get_players(self):
+    return self.players
+
+  #----------------------------------------------------------------------------
+
+  ## Plays all the matches (maps are taken in turns) using given number of
+  #  processes (None = number of CPUs) and prints the results.
+
+  def run(self, number_of_processes = None):
+    map_datas = {}
+    
+    for map_name in self.map_names:
+      with open(os.path.join(Game.MAP_PATH,map_name)) as map_file:
+        map_datas[map_name] = map_file.read()
+    
+    match_setups = []
+    
+    for i in range(self.number_of_matches):
+      map_name = self.map_names[i % len(self.map_names)]
+      match_setups.append((map_name,map_datas[map_name],self.player_slots,random.randint(0,2 ** 31 - 1)))
+    
+    players_by_numbers = {player.get_number(): player for player in self.players}
+    
+    pool = multiprocessing.Pool(number_of_processes)
+    time_start = time.time()
+    
+    for match_result in pool.imap_unordered(play_tournament_match,match_setups):
+      map_name, winner_team, map_time, kills = match_result
+      
+      for player_kills in kills:
+        player = players_by_numbers[player_kills[0]]
+        player.set_kills(player.get_kills() + player_kills[1])
+      
+      Game.acknowledge_wins(winner_team,self.players)
+      
+      print(map_name + ": " + ("draw" if winner_team < 0 else "team " + str(winner_team + 1) + " wins") + " (" + str(map_time / 1000) + " s)")
+    
+    pool.close()
+    pool.join()
+    
+    duration = max(time.time() - time_start,0.001)
+    
+    result_menu = ResultMenu(None)
+    result_menu.set_results(self.players)
+    
+    print(re.sub(r"\^#[0-9a-fA-F]{6}","",result_menu.text))    # remove the color markup
+    print(str(self.number_of_matches) + " matches in " + str(round(duration,2)) + " s (" + str(round(self.number_of_matches / duration,2)) + " matches per second)")
+    
+    return self.players
+
+#==============================================================================
+
+## Records the input actions of all players (including AIs) of one or more
+#  games into a compact binary file and plays them back without running any
+#  AI (used by the --record and --replay command line options). As the games
+#  are seeded, a game is fully determined by its setup and its inputs.
+#
+#  The file is zlib-compressed, each frame is stored as dt followed by one byte
+#  for each player in the game: bits 0 - 2 hold the first movement action + 1
+#  (0 = no movement), bit 3 is bomb, bit 4 is special and bit 5 is bomb double.
+
+class Replay(object):
+  FILE_HEADER = "BMRP"
+  FILE_VERSION = 1
+  
+  NO_SLOT = -128                  ##< stands for None in the stored player slots
+  
+  ACTION_BITS = {
+    PlayerKeyMaps.ACTION_BOMB: 8,
+    PlayerKeyMaps.ACTION_SPECIAL: 16,
+    PlayerKeyMaps.ACTION_BOMB_DOUBLE: 32
+    }
+
+  #----------------------------------------------------------------------------
+
+  def __init__(self):
+    ## list of recorded games, each one is a dict with the game setup and
+    #  frame data
+    self.games = []
+
+  #----------------------------------------------------------------------------
+
+  def get_number_of_games(self):
+    return len(self.games)
+
+  #----------------------------------------------------------------------------
+
+  def get_number_of_frames(self, game_index):
+    return self.games[game_index]["frames"]
+
+  #----------------------------------------------------------------------------
+
+  ## Starts recording a new game, all following frames will belong to it.
+
+  def start_game(self, map_data, play_setup, seed, game_number = 1, max_games = 1, all_items_cheat = False, immortal_player_numbers = []):
+    player_slots = list(play_setup.get_slots())
+    
+    self.games.append({
+      "map data": map_data,
+      "player slots": player_slots,
+      "player numbers": [i for i in range(len(player_slots)) if player_slots[i] != None],
+      "seed": seed,
+      "game number": game_number,
+      "max games": max_games,
+      "all items cheat": all_items_cheat,
+      "immortal player numbers": list(immortal_player_numbers),
+      "frames": 0,
+      "frame data": bytearray()
+      })
+
+  #----------------------------------------------------------------------------
+
+  ## Records one frame of the current game, actions are in the format returned
+  #  by PlayerKeyMaps.get_current_actions(). Must be called before the actions
+  #  are passed to the players because they can modify the list.
+
+  def record_frame(self, dt, actions):
+    game = self.games[-1]
+    action_masks = [0 for i in range(10)]
+    
+    for action in actions:
+      if action[0] < 0:
+        continue
+      
+      if action[1] in Replay.ACTION_BITS:
+        action_masks[action[0]] |= Replay.ACTION_BITS[action[1]]
+      elif action[1] <= PlayerKeyMaps.ACTION_LEFT and action_masks[action[0]] & 7 == 0:  # only the first movement counts
+        action_masks[action[0]] |= action[1] + 1
+    
+    game["frame data"].extend(struct.pack("<H",min(dt,65535)))
+    game["frame data"].extend(bytearray([action_masks[number] for number in game["player numbers"]]))
+    game["frames"] += 1
 
-                       # up                     # right                     # down                     # left
-      tile_increment  = ((0,-1),                  (1,0),                      (0,1),                     (-1,0))
-      action =          (PlayerKeyMaps.ACTION_UP, PlayerKeyMaps.ACTION_RIGHT, PlayerKeyMaps.ACTION_DOWN, PlayerKeyMaps.ACTION_LEFT)
-    
-      # should I move up, right, down or left?
+  #----------------------------------------------------------------------------
+
+  ## Returns a list of (dt, actions) for given game.
+
+  def get_frames(self, game_index):
+    game = self.games[game_index]
+    frame_data = game["frame data"]
+    frame_size = 2 + len(game["player numbers"])
+    result = []
     
-      for direction in (0,1,2,3):
-        score = self.rate_tile((current_tile[0] + tile_increment[direction][0],current_tile[1] + tile_increment[direction][1]))  
+    for offset in range(0,game["frames"] * frame_size,frame_size):
+      dt = struct.unpack("<H",bytes(frame_data[offset:offset + 2]))[0]
+      actions = []
       
-        # count in the general direction
-        extra_score = 0
+      for i in range(len(game["player numbers"])):
+        number = game["player numbers"][i]
+        action_mask = frame_data[offset + 2 + i]
         
-        if tile_increment[direction][0] == general_direction[0]:
-          extra_score += 2
+        if action_mask & 7 != 0:
+          actions.append((number,(action_mask & 7) - 1))
         
-        if tile_increment[direction][1] == general_direction[1]:
-          extra_score += 2
-          
-        score += extra_score
+        for action in Replay.ACTION_BITS:
+          if action_mask & Replay.ACTION_BITS[action]:
+            actions.append((number,action))
       
-        if score > maximum_score:
-          maximum_score = score
-          best_direction_actions = [action[direction]]
-        elif score == maximum_score:
-          best_direction_actions.append(action[direction])
+      result.append((dt,actions))
+    
+    return result
+
+  #----------------------------------------------------------------------------
+
+  def save(self, filename):
+    data = bytearray(struct.pack("<4sBI",Replay.FILE_HEADER,Replay.FILE_VERSION,len(self.games)))
+    
+    for game in self.games:
+      immortal_mask = 0
       
-      chosen_movement_action = random.choice(best_direction_actions)
+      for number in game["immortal player numbers"]:
+        immortal_mask |= 1 << number
       
-    if chosen_movement_action != None:
-      if self.player.get_disease() == Player.DISEASE_REVERSE_CONTROLS:
-        chosen_movement_action = PlayerKeyMaps.get_opposite_action(chosen_movement_action)
+      data.extend(struct.pack("<IHHBI",game["seed"],game["game number"],game["max games"],1 if game["all items cheat"] else 0,len(game["map data"])))
+      data.extend(game["map data"])
       
-      self.outputs.append((self.player.get_number(),chosen_movement_action))
+      for slot in game["player slots"]:
+        data.extend(struct.pack("<bb",*(slot if slot != None else (Replay.NO_SLOT,Replay.NO_SLOT))))
       
-      self.didnt_move_since = self.game_map.get_map_time()
+      data.extend(struct.pack("<HI",immortal_mask,game["frames"]))
+      data.extend(game["frame data"])
+    
+    with open(filename,"wb") as replay_file:
+      replay_file.write(zlib.compress(bytes(data),9))
 
-    if self.game_map.get_map_time() - self.didnt_move_since > 10000:   # didn't move for 10 seconds or more => force move
-      chosen_movement_action = random.choice((PlayerKeyMaps.ACTION_UP,PlayerKeyMaps.ACTION_RIGHT,PlayerKeyMaps.ACTION_DOWN,PlayerKeyMaps.ACTION_LEFT))
-      self.outputs.append((self.player.get_number(),chosen_movement_action))
-      
-    # bomb decisions
+  #----------------------------------------------------------------------------
+
+  @staticmethod
+  def load(filename):
+    with open(filename,"rb") as replay_file:
+      data = zlib.decompress(replay_file.read())
     
-    bomb_laid = False
+    header, version, number_of_games = struct.unpack_from("<4sBI",data,0)
+    offset = struct.calcsize("<4sBI")
     
-    if self.game_map.tile_has_bomb(current_tile):
-      # should I throw?
+    if header != Replay.FILE_HEADER or version != Replay.FILE_VERSION:
+      raise ValueError("not a replay file: " + filename)
+    
+    play_setup = PlaySetup()
+    result = Replay()
+    
+    for i in range(number_of_games):
+      seed, game_number, max_games, flags, map_data_length = struct.unpack_from("<IHHBI",data,offset)
+      offset += struct.calcsize("<IHHBI")
+      map_data = data[offset:offset + map_data_length]
+      offset += map_data_length
       
-      if self.player.can_throw() and max(escape_direction_ratings) == 0:
-        self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_BOMB_DOUBLE))
-    elif self.player.get_bombs_left() > 0 and (self.player.can_throw() or self.game_map.get_danger_value(current_tile) > 2000 and max(escape_direction_ratings) > 0): 
-      # should I lay bomb?
+      play_setup.player_slots = []
       
-      chance_to_put_bomb = 100    # one in how many
+      for j in range(10):
+        slot = struct.unpack_from("<bb",data,offset)
+        offset += 2
+        play_setup.player_slots.append(slot if slot[0] != Replay.NO_SLOT else None)
       
-      players_near = self.players_nearby()
+      immortal_mask, frames = struct.unpack_from("<HI",data,offset)
+      offset += struct.calcsize("<HI")
       
-      if players_near[0] > 0 and players_near[1] == 0:  # enemy nearby and no ally nearby
-        chance_to_put_bomb = 5
-      else:
-        block_tile_ratio = self.game_map.get_number_of_block_tiles() / float(GameMap.MAP_WIDTH * GameMap.MAP_HEIGHT)
-
-        if block_tile_ratio < 0.4:   # if there is not many tiles left, put bombs more often
-          chance_to_put_bomb = 80
-        elif block_tile_ratio < 0.2:
-          chance_to_put_bomb = 20
+      result.start_game(map_data,play_setup,seed,game_number,max_games,flags & 1 != 0,[j for j in range(10) if immortal_mask & (1 << j)])
       
-      number_of_block_neighbours = self.number_of_blocks_next_to_tile(current_tile)
-     
-      if number_of_block_neighbours == 1:
-        chance_to_put_bomb = 3
-      elif number_of_block_neighbours == 2 or number_of_block_neighbours == 3:
-        chance_to_put_bomb = 2
+      frame_data_length = frames * (2 + len(result.games[-1]["player numbers"]))
+      result.games[-1]["frame data"] = bytearray(data[offset:offset + frame_data_length])
+      result.games[-1]["frames"] = frames
+      offset += frame_data_length
+    
+    return result
+
+  #----------------------------------------------------------------------------
+
+  ## Plays back given game without any display and returns the Simulation in
+  #  the state after the last frame.
+
+  def play_game(self, game_index):
+    game = self.games[game_index]
+    play_setup = PlaySetup()
+    play_setup.player_slots = list(game["player slots"])
+    
+    simulation = Simulation(game["map data"],play_setup,game["game number"],game["max games"],game["all items cheat"],game["seed"],False)
+    simulation.immortal_player_numbers = list(game["immortal player numbers"])
+    
+    for frame in self.get_frames(game_index):
+      simulation.step(frame[0],frame[1])
+    
+    return simulation
+
+  #----------------------------------------------------------------------------
+
+  ## Plays back all the games, prints their results and returns the list of
+  #  winner teams (-1 = draw or unfinished game).
+
+  def play(self):
+    winner_teams = []
+    
+    for i in range(len(self.games)):
+      time_start = time.time()
+      simulation = self.play_game(i)
+      duration = max(time.time() - time_start,0.001)
       
-      do_lay_bomb = random.randint(0,chance_to_put_bomb) == 0
+      winner_team = simulation.get_map().get_winner_team() if simulation.is_over() else -1
+      winner_teams.append(winner_team)
       
-      if do_lay_bomb:
-        bomb_laid = True
-        
-        if random.randint(0,2) == 0 and self.should_lay_multibomb(chosen_movement_action):  # lay a single bomb or multibomb?
-          self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_BOMB_DOUBLE))
-        else:
-          self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_BOMB))
-  
-    # should I box?
+      print("game " + str(i + 1) + ": " + ("draw" if winner_team < 0 else "team " + str(winner_team + 1) + " wins") + " (" + str(simulation.get_map().get_map_time() / 1000) + " s, " + str(self.games[i]["frames"]) + " frames, " + str(int(self.games[i]["frames"] / duration)) + " frames per second)")
     
-    if self.player.can_box() and not self.player.detonator_is_active():
-      if trapped or self.game_map.tile_has_bomb(self.player.get_forward_tile_position()):
-        self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_SPECIAL))
-  
-    if bomb_laid:   # if bomb was laid, the outputs must be recomputed fast in order to prevent laying bombs to other tiles
-      self.recompute_compute_actions_on = current_time + 10
-    else:
-      self.recompute_compute_actions_on = current_time + random.randint(AI.REPEAT_ACTIONS[0],AI.REPEAT_ACTIONS[1])
+    return winner_teams
 
-    # should I detonate the detonator?
-    
-    if self.player.detonator_is_active():
-      if random.randint(0,2) == 0 and self.game_map.get_danger_value(current_tile) >= GameMap.SAFE_DANGER_VALUE:
-        self.outputs.append((self.player.get_number(),PlayerKeyMaps.ACTION_SPECIAL))
-  
-    return self.outputs
+#==============================================================================
+
+## Simulates the played game (Game.game_map, with AIs) on a background thread
+#  in fixed steps, so that slow rendering doesn't stall the simulation. The
+#  main thread never touches the simulated map meanwhile: it passes the player
+#  inputs in with set_actions() and renders its own copy of the map that is
+#  updated from the snapshots made after each simulation step. The thread
+#  stops when the game is over or the game leaves the playing state.
+
+class SimulationThread(object):
+  ONE_SHOT_ACTIONS = (PlayerKeyMaps.ACTION_BOMB_DOUBLE,)  ##< actions that are only reported in one frame and mustn't be repeated
+  MOVEMENT_ACTIONS = (PlayerKeyMaps.ACTION_UP,PlayerKeyMaps.ACTION_RIGHT,PlayerKeyMaps.ACTION_DOWN,PlayerKeyMaps.ACTION_LEFT)
 
   #----------------------------------------------------------------------------
 
-  def should_lay_multibomb(self, movement_action):
-    if self.player.can_throw():    # multibomb not possible with throwing glove
-      return False
+  def __init__(self, game):
+    self.game = game
+    self.lock = threading.Lock()               ##< guards the attributes shared by the two threads
+    self.queued_actions = []                   ##< actions of the human players from the frames since the last step, set by the main thread
+    self.held_actions = []                     ##< actions of the last frame without the one-shot ones, used by steps when no frame came since the previous step
+    self.snapshot = None                       ##< snapshot of the map after the last step, None if it has been taken already
+    self.snapshot_time = 0                     ##< time (pygame ticks) of the last snapshot
+    self.sound_events = []                     ##< events that happened since the last take_events()
+    self.animation_events = []
+    self.info_board_updates = set()            ##< numbers of the players whose info boards need an update
+    self.stop_requested = False
     
-    multibomb_count = self.player.get_multibomb_count()
+    self.render_map = copy.deepcopy(game.game_map)   ##< copy of the map that the main thread renders
+    self.render_snapshot_time = pygame.time.get_ticks()
+    self.previous_positions = {}               ##< positions in the render map before the last snapshot was restored
     
-    if multibomb_count > 1:        # multibomb possible
-      current_tile = self.player.get_tile_position()
+    self.thread = threading.Thread(target = self.__run)
+    self.thread.daemon = True
+    self.thread.start()
 
-      player_direction = movement_action if movement_action != None else self.player.get_direction_number()
+  #----------------------------------------------------------------------------
 
-      # by laying multibomb one of the escape routes will be cut off, let's check
-      # if there would be any escape routes left
+  ## Passes the actions of the human players in the current frame to the
+  #  simulation.
+
+  def set_actions(self, actions):
+    with self.lock:
+      self.queued_actions.append(actions)
+
+  #----------------------------------------------------------------------------
+
+  ## Returns the actions for the next simulation step: the actions of the
+  #  newest frame since the previous step plus the non-movement actions of the
+  #  older ones, so that even actions reported only in one frame (such as quick
+  #  taps and double presses) are performed once. Older movements are left out,
+  #  as players only perform the first movement action they get.
+
+  def take_actions(self):
+    with self.lock:
+      if len(self.queued_actions) == 0:
+        return self.held_actions
       
-      escape_direction_ratings = list(self.rate_bomb_escape_directions(current_tile))
-      escape_direction_ratings[player_direction] = 0
+      result = list(self.queued_actions[-1])
       
-      if max(escape_direction_ratings) == 0:
-        return False
+      for frame_actions in self.queued_actions[:-1]:
+        for action in frame_actions:
+          if not action[1] in SimulationThread.MOVEMENT_ACTIONS and not action in result:
+            result.append(action)
+      
+      self.held_actions = [action for action in self.queued_actions[-1] if not action[1] in SimulationThread.ONE_SHOT_ACTIONS]
+      self.queued_actions = []
+      
+    return result
 
-      direction_vector = self.player.get_direction_vector()
+  #----------------------------------------------------------------------------
+
+  ## Returns the sound and animation events that happened since the last call
+  #  as a tuple (sound events, animation events).
+
+  def take_events(self):
+    with self.lock:
+      result = (self.sound_events,self.animation_events)
+      self.sound_events = []
+      self.animation_events = []
       
-      multibomb_safe = True
+    return result
+
+  #----------------------------------------------------------------------------
+
+  ## Updates the render map to the latest snapshot and returns a tuple in
+  #  format (render map, previous positions, interpolation) with the arguments
+  #  for Renderer.render_map.
+
+  def get_render_state(self):
+    with self.lock:
+      snapshot = self.snapshot
+      snapshot_time = self.snapshot_time
+      info_board_updates = self.info_board_updates
+      self.snapshot = None
+      self.info_board_updates = set()
       
-      for i in range(multibomb_count):
-        if not self.game_map.tile_is_walkable(current_tile) or not self.game_map.tile_is_withing_map(current_tile):
-          break
-        
-        if self.game_map.get_danger_value(current_tile) < 3000 or self.game_map.tile_has_lava(current_tile):
-          multibomb_safe = False
-          break
+    if snapshot != None:
+      self.previous_positions = Game.get_object_positions(self.render_map)
+      self.render_map.restore(snapshot,True)   # the renderer keeps the unchanged block rows cached
+      self.render_snapshot_time = snapshot_time
+      
+      for player in self.render_map.get_players():
+        if player.get_number() in info_board_updates:
+          player.info_board_update_needed = True
+      
+    interpolation = min(1.0,(pygame.time.get_ticks() - self.render_snapshot_time) / float(Game.SIMULATION_STEP))
+      
+    return (self.render_map,self.previous_positions,interpolation)
+
+  #----------------------------------------------------------------------------
+
+  def is_running(self):
+    return self.thread.is_alive()
+
+  #----------------------------------------------------------------------------
+
+  ## Stops the simulation and waits for the thread to end.
+
+  def stop(self):
+    self.stop_requested = True
+    self.thread.join()
+
+  #----------------------------------------------------------------------------
+
+  def __simulation_should_run(self):
+    return not self.stop_requested and self.game.state == Game.STATE_PLAYING and self.game.game_map.get_state() != GameMap.STATE_GAME_OVER
+
+  #----------------------------------------------------------------------------
+
+  def __run(self):
+    game_map = self.game.game_map
+    time_before = pygame.time.get_ticks()
+    time_to_simulate = 0
+    
+    while self.__simulation_should_run():
+      time_now = pygame.time.get_ticks()
+      time_to_simulate += min(time_now - time_before,Game.MAX_FRAME_TIME)
+      time_before = time_now
+      
+      while time_to_simulate >= Game.SIMULATION_STEP and self.__simulation_should_run():
+        self.game.simulation_step(Game.SIMULATION_STEP,self.take_actions())
+        time_to_simulate -= Game.SIMULATION_STEP
         
-        current_tile = (current_tile[0] + direction_vector[0],current_tile[1] + direction_vector[1])
+        sound_events = game_map.get_and_clear_sound_events()
+        animation_events = game_map.get_and_clear_animation_events()
+        info_board_updates = [player.get_number() for player in game_map.get_players() if player.info_board_needs_update()]
+        snapshot = game_map.snapshot()      # made after clearing the events, they are passed separately
         
-      if multibomb_safe:
-        return True
+        with self.lock:
+          self.sound_events.extend(sound_events)
+          self.animation_events.extend(animation_events)
+          self.info_board_updates.update(info_board_updates)
+          self.snapshot = snapshot
+          self.snapshot_time = time_now
       
-    return False
+      pygame.time.wait(max(0,Game.SIMULATION_STEP - time_to_simulate))
 
 #==============================================================================
     
@@ -4972,6 +6939,11 @@ class Settings(StringSerializable):
     self.screen_resolution = Settings.POSSIBLE_SCREEN_RESOLUTIONS[0]
     self.fullscreen = False
     self.control_by_mouse = False
+    self.dirty_rects = False       ##< only update the changed parts of the screen in game (faster on slow machines)
+    self.scale_map = False         ##< scale the map to fill the screen instead of drawing it in its original size
+    self.fps_limit = 60            ##< maximum number of frames rendered per second, 0 means no limit
+    self.vsync = False             ##< synchronize the screen updates with the monitor refresh, if supported
+    self.threaded_simulation = False  ##< simulate the game on a different thread from the rendering (see SimulationThread)
     self.player_key_maps.reset()
 
   #----------------------------------------------------------------------------
@@ -4984,6 +6956,11 @@ class Settings(StringSerializable):
     result += "screen resolution: " + str(self.screen_resolution[0]) + "x" + str(self.screen_resolution[1]) + "\n"
     result += "fullscreen: " + str(self.fullscreen) + "\n"
     result += "control by mouse: " + str(self.control_by_mouse) + "\n"
+    result += "dirty rects: " + str(self.dirty_rects) + "\n"
+    result += "scale map: " + str(self.scale_map) + "\n"
+    result += "fps limit: " + str(self.fps_limit) + "\n"
+    result += "vsync: " + str(self.vsync) + "\n"
+    result += "threaded simulation: " + str(self.threaded_simulation) + "\n"
     result += Settings.CONTROL_MAPPING_DELIMITER + "\n"
     
     result += self.player_key_maps.save_to_string() + "\n"
@@ -5032,6 +7009,16 @@ class Settings(StringSerializable):
         self.fullscreen = True if value_string == "True" else False     
       elif key_string == "control by mouse":
         self.control_by_mouse = True if value_string == "True" else False
+      elif key_string == "dirty rects":
+        self.dirty_rects = True if value_string == "True" else False
+      elif key_string == "scale map":
+        self.scale_map = True if value_string == "True" else False
+      elif key_string == "fps limit":
+        self.fps_limit = max(0,int(value_string))
+      elif key_string == "vsync":
+        self.vsync = True if value_string == "True" else False
+      elif key_string == "threaded simulation":
+        self.threaded_simulation = True if value_string == "True" else False
 
   #----------------------------------------------------------------------------
     
@@ -5096,8 +7083,12 @@ class Game(object):
   
   NUMBER_OF_CONTROLLED_PLAYERS = 4    ##< maximum number of non-AI players on one PC
   
+  SIMULATION_STEP = Simulation.DEFAULT_DT   ##< fixed time step (in ms) by which the game is simulated, the same as in headless simulation
+  MAX_FRAME_TIME = 100                ##< longer frames are cut to this time (in ms) so that the simulation can catch up after a stall
+  
   RESOURCE_PATH = "resources"
   MAP_PATH = "maps"
+  CACHE_PATH = "cache"                ##< directory for files computed from the resources, such as colored player images
   SETTINGS_FILE_PATH = "settings.txt"
 
   #----------------------------------------------------------------------------
@@ -5125,13 +7116,18 @@ class Game(object):
     
     pygame.display.set_caption("Bombman")
     
-    self.renderer = Renderer()
+    self.asset_loader = AssetLoader()
+    
+    self.renderer = Renderer(self.asset_loader)
     self.apply_screen_settings()
     
-    self.sound_player = SoundPlayer()
+    self.sound_player = SoundPlayer(self.asset_loader)
+    self.wait_for_assets()
     self.sound_player.change_music()
     self.apply_sound_settings()
     
+    self.renderer.prepare_game_images()   # the images only needed in game are loaded in background while in menu
+    
     self.apply_other_settings()
              
     self.map_name = ""
@@ -5149,12 +7145,39 @@ class Game(object):
     self.menu_controls = ControlsMenu(self.sound_player,self.player_key_maps,self)
     self.menu_results = ResultMenu(self.sound_player)
     
-    self.ais = []
+    self.simulation = None               ##< Simulation of the game being played
     
     self.state = Game.STATE_MENU_MAIN
 
     self.immortal_players_numbers = []
     self.active_cheats = set()
+    
+    self.simulation_thread = None        ##< SimulationThread simulating the game if threaded simulation is on and the game is being played
+    
+    self.replay = None                   ##< if not None, the games are recorded into this Replay
+    self.replay_file_path = None
+
+  #----------------------------------------------------------------------------
+
+  ## Makes the game record all played games into given replay file.
+
+  def record_replay(self, file_path):
+    self.replay = Replay()
+    self.replay_file_path = file_path
+
+  #----------------------------------------------------------------------------
+
+  ## Shows the loading screen until the assets being loaded by the asset
+  #  loader in background are loaded.
+
+  def wait_for_assets(self):
+    while not self.asset_loader.is_done():
+      pygame.event.pump()                        # keep the window responding
+      self.renderer.render_loading_screen(self.asset_loader.get_progress())
+      pygame.display.flip()
+      pygame.time.wait(20)
+      
+    self.asset_loader.wait()
 
   #----------------------------------------------------------------------------
 
@@ -5199,12 +7222,22 @@ class Game(object):
     if self.settings.fullscreen:
       display_flags += pygame.FULLSCREEN
  
-    self.screen = pygame.display.set_mode(self.settings.screen_resolution,display_flags)
+    self.screen = None
+    
+    if self.settings.vsync and hasattr(pygame,"SCALED"):    # pygame 2 only supports vsync with scaled displays
+      try:
+        self.screen = pygame.display.set_mode(self.settings.screen_resolution,display_flags | pygame.SCALED,vsync = 1)
+      except pygame.error:
+        debug_log("vsync is not available")
+    
+    if self.screen == None:
+      self.screen = pygame.display.set_mode(self.settings.screen_resolution,display_flags)
     
     screen_center = (Renderer.get_screen_size()[0] / 2,Renderer.get_screen_size()[1] / 2)
     pygame.mouse.set_pos(screen_center)
     
     self.renderer.update_screen_info()
+    self.renderer.convert_images()
 
   #----------------------------------------------------------------------------
   
@@ -5216,6 +7249,8 @@ class Game(object):
   
   def apply_other_settings(self):
     self.player_key_maps.allow_control_by_mouse(self.settings.control_by_mouse)
+    self.renderer.set_dirty_rects_mode(self.settings.dirty_rects)
+    self.renderer.set_map_scaling(self.settings.scale_map)
 
   #----------------------------------------------------------------------------
   
@@ -5351,23 +7386,64 @@ class Game(object):
 
   #----------------------------------------------------------------------------
 
-  def acknowledge_wins(self, winner_team_number, players):
+  ## Returns the current positions of players and bombs in given map as a
+  #  dict (object : position), used to interpolate them in rendering.
+
+  @staticmethod
+  def get_object_positions(game_map):
+    result = {}
+    
+    for what in game_map.get_players() + game_map.get_bombs():
+      result[what] = tuple(what.get_position())
+      
+    return result
+
+  #----------------------------------------------------------------------------
+
+  ## Adds a win to each of given players that is in the winner team.
+
+  @staticmethod
+  def acknowledge_wins(winner_team_number, players):
     for player in players:
       if player.get_team_number() == winner_team_number:
         player.set_wins(player.get_wins() + 1)    
 
   #----------------------------------------------------------------------------
 
+  ## Handles the end of the played game: starts the next one or shows the
+  #  final results.
+
+  def game_over(self):
+    if self.replay != None:
+      self.replay.save(self.replay_file_path)
+    
+    self.game_number += 1
+    
+    if self.game_number > self.play_setup.get_number_of_games():
+      previous_winner = self.game_map.get_winner_team()
+      self.acknowledge_wins(previous_winner,self.game_map.get_players())
+      self.menu_results.set_results(self.game_map.get_players())
+      self.game_map = None
+      self.state = Game.STATE_MENU_RESULTS   # show final results
+      self.deactivate_all_cheats()
+    else:
+      self.state = Game.STATE_GAME_STARTED   # new game
+
+  #----------------------------------------------------------------------------
+
   def run(self):
     time_before = pygame.time.get_ticks()
 
     show_fps_in = 0
     pygame_clock = pygame.time.Clock()
+    
+    time_to_simulate = 0                         # time (in ms) not simulated yet, always less than SIMULATION_STEP after simulating
+    previous_positions = {}                      # positions of players and bombs before the last simulation step
 
     while True:                                  # main loop
       profiler.measure_start("main loop")
       
-      dt = min(pygame.time.get_ticks() - time_before,100)
+      dt = min(pygame.time.get_ticks() - time_before,Game.MAX_FRAME_TIME)
       time_before = pygame.time.get_ticks()
 
       pygame_events = []
@@ -5380,32 +7456,64 @@ class Game(object):
 
       self.player_key_maps.process_pygame_events(pygame_events,self.frame_number)
 
-      if self.state == Game.STATE_PLAYING:
-        self.renderer.process_animation_events(self.game_map.get_and_clear_animation_events()) # play animations
-        self.sound_player.process_events(self.game_map.get_and_clear_sound_events())           # play sounds
+      if self.state != Game.STATE_PLAYING and self.simulation_thread != None:   # paused or quit, stop the simulation before anything touches the map
+        self.simulation_thread.stop()
+        self.simulation_thread = None
+
+      screen_update_rects = None                 # None = update the whole screen
+
+      if self.state == Game.STATE_PLAYING and self.settings.threaded_simulation:
+        if self.simulation_thread == None:
+          self.simulation_thread = SimulationThread(self)
+        
+        self.simulation_thread.set_actions(self.player_key_maps.get_current_actions())
+        
+        sound_events, animation_events = self.simulation_thread.take_events()
+        self.renderer.process_animation_events(animation_events)  # play animations
+        self.sound_player.process_events(sound_events)            # play sounds
         
         profiler.measure_start("map rend.")
-        self.screen.blit(self.renderer.render_map(self.game_map),(0,0)) 
+        render_map, previous_positions, interpolation = self.simulation_thread.get_render_state()
+        self.renderer.render_map(render_map,previous_positions,interpolation)  # renders directly to the screen
+        screen_update_rects = self.renderer.get_dirty_rects()
         profiler.measure_stop("map rend.")
         
+        if not self.simulation_thread.is_running():   # the game is over or paused
+          self.simulation_thread.stop()
+          self.simulation_thread = None
+          
+        if self.simulation_thread == None and self.game_map.get_state() == GameMap.STATE_GAME_OVER:
+          self.game_over()
+      elif self.state == Game.STATE_PLAYING:
         profiler.measure_start("sim.")
-        self.simulation_step(dt)
+        
+        time_to_simulate += dt
+        
+        # simulate in fixed steps so that the game doesn't depend on the frame rate:
+        
+        while time_to_simulate >= Game.SIMULATION_STEP and self.state == Game.STATE_PLAYING and self.game_map.get_state() != GameMap.STATE_GAME_OVER:
+          previous_positions = Game.get_object_positions(self.game_map)
+          self.simulation_step(Game.SIMULATION_STEP)
+          time_to_simulate -= Game.SIMULATION_STEP
+        
         profiler.measure_stop("sim.")
         
+        self.renderer.process_animation_events(self.game_map.get_and_clear_animation_events()) # play animations
+        self.sound_player.process_events(self.game_map.get_and_clear_sound_events())           # play sounds
+        
+        profiler.measure_start("map rend.")
+        self.renderer.render_map(self.game_map,previous_positions,time_to_simulate / float(Game.SIMULATION_STEP))  # renders directly to the screen
+        screen_update_rects = self.renderer.get_dirty_rects()
+        profiler.measure_stop("map rend.")
+        
         if self.game_map.get_state() == GameMap.STATE_GAME_OVER:
-          self.game_number += 1
-          
-          if self.game_number > self.play_setup.get_number_of_games():
-            previous_winner = self.game_map.get_winner_team()
-            self.acknowledge_wins(previous_winner,self.game_map.get_players())
-            self.menu_results.set_results(self.game_map.get_players())
-            self.game_map = None
-            self.state = Game.STATE_MENU_RESULTS   # show final results
-            self.deactivate_all_cheats()
-          else:
-            self.state = Game.STATE_GAME_STARTED   # new game
+          self.game_over()
       elif self.state == Game.STATE_GAME_STARTED:
         debug_log("starting game " + str(self.game_number))
+        
+        if not self.renderer.game_images_loaded:
+          self.wait_for_assets()
+          self.renderer.load_game_images()
     
         previous_winner = -1
     
@@ -5424,7 +7532,8 @@ class Game(object):
         
         with open(os.path.join(Game.MAP_PATH,map_name_to_load)) as map_file:
           map_data = map_file.read()
-          self.game_map = GameMap(map_data,self.play_setup,self.game_number,self.play_setup.get_number_of_games(),self.cheat_is_active(Game.CHEAT_ALL_ITEMS))
+          self.simulation = Simulation(map_data,self.play_setup,self.game_number,self.play_setup.get_number_of_games(),self.cheat_is_active(Game.CHEAT_ALL_ITEMS))
+          self.game_map = self.simulation.get_map()
           
         player_slots = self.play_setup.get_slots()
         
@@ -5435,11 +7544,12 @@ class Game(object):
             if player_slots[i] != None and player_slots[i][0] >= 0:   # cheat: if not AI
               self.immortal_players_numbers.append(i)                 # make the player immortal
         
-        self.ais = []
-        
-        for i in range(len(player_slots)):
-          if player_slots[i] != None and player_slots[i][0] < 0:  # indicates AI
-            self.ais.append(AI(self.game_map.get_players_by_numbers()[i],self.game_map))
+        self.simulation.immortal_player_numbers = self.immortal_players_numbers
+        self.simulation.replay = self.replay
+        self.simulation.keep_events = True       # the sounds and animations are played
+      
+        if self.replay != None:
+          self.replay.start_game(map_data,self.play_setup,self.game_map.get_seed(),self.game_number,self.play_setup.get_number_of_games(),self.cheat_is_active(Game.CHEAT_ALL_ITEMS),self.immortal_players_numbers)
       
         for player in self.game_map.get_players():
           player.set_kills(kill_counts[player.get_number()])
@@ -5449,17 +7559,29 @@ class Game(object):
         
         self.sound_player.change_music()
         self.state = Game.STATE_PLAYING
+        
+        time_to_simulate = 0
+        previous_positions = {}
       elif self.state == Game.STATE_EXIT:
+        if self.replay != None:
+          self.replay.save(self.replay_file_path)
+        
         break
       else:   # in menu
         self.manage_menus()
         
         profiler.measure_start("menu rend.")
-        self.screen.blit(self.renderer.render_menu(self.active_menu,self),(0,0))  
+        self.renderer.render_menu(self.active_menu,self)     # renders directly to the screen
         profiler.measure_stop("menu rend.")
+        
+        screen_update_rects = self.renderer.get_dirty_rects()
 
-      pygame.display.flip()
-      pygame_clock.tick()
+      if screen_update_rects == None:
+        pygame.display.flip()
+      else:
+        pygame.display.update(screen_update_rects)
+        
+      pygame_clock.tick(self.settings.fps_limit)  # waits so that the frame rate doesn't exceed the limit
 
       if show_fps_in <= 0:
         if DEBUG_FPS:
@@ -5489,35 +7611,21 @@ class Game(object):
 
   #----------------------------------------------------------------------------
 
-  def simulation_step(self, dt):
-    actions_being_performed = self.filter_out_disallowed_actions(self.player_key_maps.get_current_actions())
+  ## Simulates one step of the played game. The actions of the human players
+  #  are read from the keyboard if they're not given.
+
+  def simulation_step(self, dt, input_actions = None):
+    if input_actions == None:
+      input_actions = self.player_key_maps.get_current_actions()
+    
+    actions_being_performed = self.filter_out_disallowed_actions(input_actions)
     
     for action in actions_being_performed:
       if action[0] == -1:                                # menu key pressed
         self.state = Game.STATE_MENU_PLAY
         return
     
-    profiler.measure_start("sim. AIs")
-    
-    for i in range(len(self.ais)):
-      actions_being_performed = actions_being_performed + self.ais[i].play()
-      
-    profiler.measure_stop("sim. AIs")
-    
-    players = self.game_map.get_players()
-
-    profiler.measure_start("sim. inputs")
-    
-    for player in players:
-      player.react_to_inputs(actions_being_performed,dt,self.game_map)
-      
-    profiler.measure_stop("sim. inputs")
-      
-    profiler.measure_start("sim. map update")
-    
-    self.game_map.update(dt,self.immortal_players_numbers)
-    
-    profiler.measure_stop("sim. map update")
+    self.simulation.step(dt,actions_being_performed)   # AIs play in the simulation
 
   #----------------------------------------------------------------------------
 
@@ -5544,7 +7652,19 @@ class Game(object):
     
 if __name__ == "__main__":
   profiler = Profiler()   # profiler object is global, for simple access
+  
+  if "--tournament" in sys.argv:   # plays AI-only games without any display
+    Tournament.from_command_line(sys.argv).run()
+    sys.exit(0)
+  
+  if "--replay" in sys.argv:       # plays back a recorded replay file without any display
+    Replay.load(get_argument_value(sys.argv,"--replay")).play()
+    sys.exit(0)
+  
   game = Game()
+  
+  if "--record" in sys.argv:       # records the played games into a replay file
+    game.record_replay(get_argument_value(sys.argv,"--record"))
 
   if len(sys.argv) > 1: 
     if "--test" in sys.argv:       # allows to quickly init a game
@@ -246,6 +246,89 @@ for i in range(50):
 assertion("map state = STATE_GAME_OVER",test_map.get_state() == bombman.GameMap.STATE_GAME_OVER)
 assertion("map winning team = 3",test_map.get_winner_team() == 3)
 
+#       ========================================
+#       run a headless game with AI players only
+#       ========================================
+
+print("creating a headless simulation of 4 AI players on the classic map")
+ai_play_setup = bombman.PlaySetup()
+ai_play_setup.player_slots = [((-1,i) if i < 4 else None) for i in range(10)]
+simulation = bombman.Simulation(map_data,ai_play_setup)
+
+for i in range(100):
+  simulation.step(20)
+
+assertion("map time = 2000",simulation.get_map().get_map_time() == 2000)
+assertion("display hasn't been initialised",pygame.display.get_surface() == None)
+assertion("4 AIs created",len(simulation.ais) == 4)
+
+print("making a snapshot of the map, simulating a while and restoring it")
+snapshot = simulation.get_map().snapshot()
+bombs_before = len(simulation.get_map().get_bombs())
+player_positions_before = [player.get_position() for player in simulation.get_map().get_players()]
+
+for i in range(100):
+  simulation.step(20)
+
+block_layer_versions = [simulation.get_map().get_block_layer_version(y) for y in range(bombman.GameMap.MAP_HEIGHT)]
+simulation.get_map().restore(snapshot)
+
+assertion("map time = 2000 after restore",simulation.get_map().get_map_time() == 2000)
+assertion("number of bombs restored",len(simulation.get_map().get_bombs()) == bombs_before)
+assertion("player positions restored",[player.get_position() for player in simulation.get_map().get_players()] == player_positions_before)
+assertion("snapshot of restored map is the same",simulation.get_map().snapshot() == snapshot)
+assertion("all block layer rows changed by restore",all([simulation.get_map().get_block_layer_version(y) != block_layer_versions[y] for y in range(bombman.GameMap.MAP_HEIGHT)]))
+
+block_layer_versions = [simulation.get_map().get_block_layer_version(y) for y in range(bombman.GameMap.MAP_HEIGHT)]
+simulation.get_map().restore(snapshot,True)
+
+assertion("unchanged block layer rows kept by restore",all([simulation.get_map().get_block_layer_version(y) == block_layer_versions[y] for y in range(bombman.GameMap.MAP_HEIGHT)]))
+
+bomb_map = simulation.get_map()
+bomb_map.get_players()[0].lay_bomb(bomb_map)
+bomb = bomb_map.get_bombs()[-1]
+bomb_map.restore(bomb_map.snapshot())
+
+assertion("bombs are kept by restore",bomb_map.get_bombs()[-1] is bomb)
+
+print("simulating the game till the end")
+winner_team = simulation.run()
+
+assertion("game has finished or timed out",simulation.is_over() or simulation.get_map().get_map_time() >= bombman.Simulation.MAX_MAP_TIME)
+assertion("no sound events piled up",len(simulation.get_map().get_and_clear_sound_events()) == 0)
+
+print("playing a tournament match")
+match_result = bombman.play_tournament_match(("classic",map_data,ai_play_setup.get_slots(),123))
+
+assertion("match result has kills of 4 players",len(match_result[3]) == 4)
+assertion("match winner is a valid team or a draw",match_result[1] in (-1,0,1,2,3))
+
+print("simulating two games with the same seed")
+simulations = [bombman.Simulation(map_data,ai_play_setup,seed=456) for i in range(2)]
+
+for simulation in simulations:
+  for i in range(500):
+    simulation.step(20)
+
+assertion("seed is kept",simulations[0].get_map().get_seed() == 456)
+assertion("both games are the same",simulations[0].get_map().snapshot() == simulations[1].get_map().snapshot())
+
+print("recording a replay of a game and playing it back")
+simulation = bombman.Simulation(map_data,ai_play_setup,seed=789)
+simulation.replay = bombman.Replay()
+simulation.replay.start_game(map_data,ai_play_setup,simulation.get_map().get_seed())
+
+for i in range(1000):
+  simulation.step(20)
+
+simulation.replay.save("test_replay.tmp")
+replay = bombman.Replay.load("test_replay.tmp")
+os.remove("test_replay.tmp")
+
+assertion("replay has 1000 frames",replay.get_number_of_games() == 1 and replay.get_number_of_frames(0) == 1000)
+assertion("destroyed blocks changed block layer rows",max([simulation.get_map().get_block_layer_version(y) for y in range(bombman.GameMap.MAP_HEIGHT)]) > 0)
+assertion("played back game is the same",replay.play_game(0).get_map().snapshot() == simulation.get_map().snapshot())
+
 #       =================
 #       test other things
 #       =================
@@ -256,10 +339,167 @@ assertion("ACTION_LEFT is opposite of ACTION_RIGHT",bombman.PlayerKeyMaps.get_op
 print("init game")
 game = bombman.Game()
 
+print("loading game images in background")
+assertion("sounds are loaded before the menu shows",len(game.sound_player.sounds) > 0 and game.sound_player.sounds[bombman.SoundPlayer.SOUND_EVENT_CLICK] != None)
+
+game.renderer.load_game_images()
+
+assertion("game images are loaded",game.renderer.game_images_loaded and len(game.renderer.player_images) == 10)
+assertion("no loading tasks are left",game.asset_loader.is_done() and game.asset_loader.get_progress() == 1.0)
+
+player_image_path = os.path.join(bombman.Game.RESOURCE_PATH,"player_up.png")
+colored_image = game.renderer.load_colored_image(player_image_path,3)
+
+assertion("colored images are cached on disk",os.path.isdir(bombman.Game.CACHE_PATH) and len(os.listdir(bombman.Game.CACHE_PATH)) > 0)
+assertion("cached colored image is the same as the computed one",pygame.image.tostring(colored_image,"RGBA") == pygame.image.tostring(game.renderer.color_surface(pygame.image.load(player_image_path),3),"RGBA"))
+
+task = game.asset_loader.submit(lambda x: x * 2,(21,))
+game.asset_loader.wait()
+
+assertion("asset loader returns the task result",task.get() == 42)
+
+print("rendering a map in dirty rects mode")
+bombman.profiler = bombman.Profiler()    # normally created in bombman's main
+render_map = bombman.GameMap(map_data,ai_play_setup,1,1)
+game.renderer.set_dirty_rects_mode(True)
+game.renderer.render_map(render_map)
+
+assertion("first frame updates the whole screen",game.renderer.get_dirty_rects() == None)
+
+game.renderer.render_map(render_map)
+dirty_rects = game.renderer.get_dirty_rects()
+
+assertion("second frame updates only a part of the screen",dirty_rects != None and sum([rect.width * rect.height for rect in dirty_rects]) < game.screen.get_width() * game.screen.get_height())
+game.renderer.set_dirty_rects_mode(False)
+
+print("rendering a jumping player")
+render_map.get_players()[0].send_to_air(render_map)
+game.renderer.render_map(render_map)
+game.renderer.render_map(render_map)
+
+assertion("scaled jump sprite is cached",len(game.renderer.jump_sprite_cache) == 1)
+
+print("rendering a map between two simulation steps")
+interpolated_player = render_map.get_players()[1]
+interpolated_player.set_position((3.5,2.5))
+previous_positions = {interpolated_player: (2.5,2.5)}
+
+assertion("position is interpolated",bombman.Renderer.get_interpolated_position(interpolated_player,previous_positions,0.25) == (2.75,2.5))
+assertion("teleported player is not interpolated",bombman.Renderer.get_interpolated_position(interpolated_player,{interpolated_player: (9.5,7.5)},0.25) == (3.5,2.5))
+
+game.renderer.render_map(render_map,previous_positions,0.25)
+
+print("rendering a map during earthquake")
+render_map.start_earthquake()
+assertion("earthquake frame is drawn directly to the screen",game.renderer.render_map(render_map) is pygame.display.get_surface())
+
+print("rendering a scaled map")
+assertion("map scale for 960x720 is 1",bombman.Renderer.get_map_scale_for_resolution((960,720)) == 1.0)
+
+previous_resolution = game.settings.screen_resolution
+game.settings.screen_resolution = (1920,1080)
+game.apply_screen_settings()
+game.renderer.set_map_scaling(True)
+game.renderer.render_map(render_map)
+map_scale = game.renderer.map_scale
+
+assertion("map scale fits the screen",map_scale > 1.0 and game.renderer.prerendered_map_background.get_height() + bombman.Renderer.MAP_SCALE_RESERVED_HEIGHT <= game.screen.get_height())
+assertion("map images are scaled",game.renderer.bomb_images[0].get_width() == bombman.Renderer.scale_length(game.renderer.unscaled_images[2][0].get_width(),map_scale))
+assertion("scaled images are cached",map_scale in game.renderer.scaled_images)
+
+game.renderer.set_map_scaling(False)
+
+assertion("original images are used without scaling",game.renderer.bomb_images[0] is game.renderer.unscaled_images[2][0])
+
+game.settings.screen_resolution = previous_resolution
+game.apply_screen_settings()
+
+print("simulating the game on a separate thread")
+game.simulation = bombman.Simulation(map_data,ai_play_setup)
+game.simulation.keep_events = True
+game.game_map = game.simulation.get_map()
+game.state = bombman.Game.STATE_PLAYING
+simulation_thread = bombman.SimulationThread(game)
+pygame.time.wait(200)
+thread_render_map, previous_positions, interpolation = simulation_thread.get_render_state()
+
+assertion("map is simulated on the thread",game.game_map.get_map_time() > 0)
+assertion("rendered map is a copy updated from snapshots",thread_render_map is not game.game_map and thread_render_map.get_map_time() > 0)
+
+game.renderer.render_map(thread_render_map,previous_positions,interpolation)
+game.state = bombman.Game.STATE_MENU_PLAY
+simulation_thread.stop()
+
+assertion("thread stops when the game is paused",not simulation_thread.is_running())
+
+simulation_thread.set_actions([(0,bombman.PlayerKeyMaps.ACTION_UP),(0,bombman.PlayerKeyMaps.ACTION_BOMB_DOUBLE)])
+simulation_thread.set_actions([(0,bombman.PlayerKeyMaps.ACTION_LEFT)])
+
+assertion("newest movement and older one-frame actions are performed",simulation_thread.take_actions() == [(0,bombman.PlayerKeyMaps.ACTION_LEFT),(0,bombman.PlayerKeyMaps.ACTION_BOMB_DOUBLE)])
+assertion("held actions are repeated but one-shot actions are not",simulation_thread.take_actions() == [(0,bombman.PlayerKeyMaps.ACTION_LEFT)])
+
+game.game_map = None
+game.simulation = None
+game.state = bombman.Game.STATE_MENU_MAIN
+
+print("loading an image through the image cache")
+image_path = os.path.join(bombman.Game.RESOURCE_PATH,"bomb1.png")
+image = game.renderer.image_cache.load(image_path)
+
+assertion("image is loaded only once",game.renderer.image_cache.load(image_path) is image)
+assertion("image is converted to the display format",image.get_bitsize() == game.screen.get_bitsize())
+
+atlas = game.renderer.texture_atlas
+bomb_image = game.renderer.bomb_images[0]
+
+floor_image = game.renderer.environment_images["env1"][0]
+
+assertion("bomb image is in the texture atlas",bomb_image.get_parent() is atlas.surface)
+assertion("opaque floor image is in the atlas without alpha",floor_image.get_parent() is atlas.opaque_surface and not floor_image.get_flags() & pygame.SRCALPHA)
+
+print("rendering text through the text cache")
+text_image = game.renderer.render_text(game.renderer.font_normal,"cached text",(255,255,255))
+text_runs_cached = len(game.renderer.text_run_cache)
+
+assertion("text pieces are cached",text_runs_cached > 0)
+assertion("text is as wide as rendered by the font at once",text_image.get_width() == game.renderer.font_normal.size("cached text")[0])
+
+text_image2 = game.renderer.render_text(game.renderer.font_normal,"cached text",(255,255,255))
+
+assertion("cached text has the same size",text_image2.get_size() == text_image.get_size())
+assertion("cached text is returned as a copy",text_image2 is not text_image)
+
+game.renderer.render_text(game.renderer.font_normal,"cached text\n",(255,255,255))
+
+assertion("already cached text pieces are reused",len(game.renderer.text_run_cache) == text_runs_cached)
+
 print("init animation")
 
 animation = bombman.Animation(os.path.join(bombman.Game.RESOURCE_PATH,"animation_explosion"),1,10,".png",7)
 
+assertion("no animation frames to draw",len(animation.get_draw_list()) == 0)
+animation.play((100,100))
+assertion("one animation frame to draw after play",len(animation.get_draw_list()) == 1)
+
+print("rendering a menu in dirty rects mode")
+render_menu = bombman.MainMenu(game.sound_player)
+game.renderer.set_dirty_rects_mode(True)
+game.renderer.render_menu(render_menu,game)
+
+assertion("first menu frame updates the whole screen",game.renderer.get_dirty_rects() == None)
+
+game.renderer.render_menu(render_menu,game)
+dirty_rects = game.renderer.get_dirty_rects()
+
+assertion("unchanged menu updates only a part of the screen",dirty_rects != None and sum([rect.width * rect.height for rect in dirty_rects]) < game.screen.get_width() * game.screen.get_height())
+
+render_menu.process_inputs([])
+render_menu.process_inputs([(0,bombman.PlayerKeyMaps.ACTION_DOWN)])
+game.renderer.render_menu(render_menu,game)
+
+assertion("menu is composed again after the selection changes",game.renderer.get_dirty_rects() == None)
+game.renderer.set_dirty_rects_mode(False)
+
 print("init main menu")
 main_menu = bombman.MainMenu(game.sound_player)
 
@@ -306,6 +546,11 @@ settings.music_volume = 0.3
 settings.sound_volume = 0
 settings.fullscreen = True
 settings.control_by_mouse = True
+settings.dirty_rects = True
+settings.scale_map = True
+settings.fps_limit = 30
+settings.vsync = True
+settings.threaded_simulation = True
 
 print("save and reload settings to/from string")
 
@@ -318,6 +563,11 @@ assertion("music on",settings.music_is_on())
 assertion("sound off",not settings.sound_is_on())
 assertion("fullscreen",settings.fullscreen)
 assertion("mouse control",settings.control_by_mouse)
+assertion("dirty rects",settings.dirty_rects)
+assertion("scale map",settings.scale_map)
+assertion("fps limit",settings.fps_limit == 30)
+assertion("vsync",settings.vsync)
+assertion("threaded simulation",settings.threaded_simulation)
 assertion("key map - action up, player 0 = 'a'",settings.player_key_maps.get_players_key_mapping(0)[bombman.PlayerKeyMaps.ACTION_UP] == pygame.K_a)
 
 print("=====================")